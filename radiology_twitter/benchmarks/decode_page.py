@@ -0,0 +1,153 @@
+"""
+Micro-benchmark for decoding and transforming one search page.
+
+"before" is the old path: response.json() twice, organizeMedia /
+organizeAuthors and a chain of .get() calls per tweet. "after" is
+twitter_client.decoder, followed by the joins buildTweet does, so both
+sides end with the same rows.
+
+    python benchmarks/decode_page.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twitter_client import decoder
+
+
+def syntheticPage(size=100):
+    users = [
+        {
+            "id": str(i), "username": f"user{i}", "name": f"User {i}",
+            "description": "Radiologist. " * 10,
+            "public_metrics": {"followers_count": i, "following_count": i, "tweet_count": i}
+        }
+        for i in range(size // 2)
+    ]
+
+    media = [{"media_key": f"3_{i}", "type": "photo", "url": f"https://pbs.twimg.com/{i}.jpg"} for i in range(size // 4)]
+
+    tweets = [
+        {
+            "id": str(10 ** 18 + i), "text": "Interesting case #radiology #xray " * 4,
+            "created_at": "2021-10-01T12:00:00.000Z", "lang": "en",
+            "author_id": str(i % (size // 2)), "conversation_id": str(10 ** 18 + i),
+            "public_metrics": {"retweet_count": 1, "reply_count": 2, "like_count": 3, "quote_count": 4},
+            "entities": {
+                "hashtags": [{"start": 0, "end": 10, "tag": "radiology"}, {"start": 11, "end": 16, "tag": "xray"}],
+                "mentions": [{"start": 0, "end": 5, "username": "someone"}]
+            },
+            "referenced_tweets": [{"type": "replied_to", "id": "1"}],
+            "attachments": {"media_keys": [f"3_{i % (size // 4)}"]}
+        }
+        for i in range(size)
+    ]
+
+    return json.dumps({
+        "data": tweets,
+        "includes": {"users": users, "media": media},
+        "meta": {"result_count": size, "next_token": "abc"}
+    }).encode()
+
+
+def before(body):
+    next_token = json.loads(body).get("meta").get("next_token")
+    page = json.loads(body)
+
+    media_objects = {m.get("media_key"): m.get("url", '') for m in page.get("includes", {}).get("media")}
+    author_objects = {}
+
+    for author in page.get("includes", {}).get("users"):
+        author_objects[author.get("id")] = {
+            "username": author.get("username"),
+            "url": f"https://twitter.com/{author.get('username')}",
+            "bio": author.get("description"),
+            "name": author.get("name"),
+            "metrics": author.get("public_metrics")
+        }
+
+    rows = []
+
+    for tweet in page.get("data", []):
+        author = author_objects.get(tweet.get("author_id"))
+        metrics = tweet.get("public_metrics")
+        entities = tweet.get("entities", {})
+        reply_to = retweet_to = quoted_tweet = None
+
+        for rt in tweet.get("referenced_tweets", []):
+            if rt.get("type") == "retweeted":
+                retweet_to = rt.get("id")
+            elif rt.get("type") == "replied_to":
+                reply_to = rt.get("id")
+            elif rt.get("type") == "quoted_tweet":
+                quoted_tweet = rt.get("id")
+
+        rows.append({
+            "tweet_id": tweet.get("id"),
+            "text": tweet.get("text"),
+            "created_at": str(tweet.get("created_at")),
+            "language": tweet.get("lang"),
+            "hashtags": ",".join(f'#{h.get("tag")}' for h in entities.get("hashtags", [])),
+            "mentions": ",".join(f'@{m.get("username")}' for m in entities.get("mentions", [])),
+            "media": ",".join(media_objects.get(m) for m in tweet.get("attachments", {}).get("media_keys", [])),
+            "retweet_count": metrics.get("retweet_count"),
+            "reply_count": metrics.get("reply_count"),
+            "like_count": metrics.get("like_count"),
+            "quote_count": metrics.get("quote_count"),
+            "author_username": author.get("username"),
+            "author_bio": author.get("bio"),
+            "author_name": author.get("name"),
+            "author_followers_count": author.get("metrics").get("followers_count"),
+            "reply_to": reply_to,
+            "retweet_to": retweet_to,
+            "quoted_tweet": quoted_tweet
+        })
+
+    return next_token, rows
+
+
+def after(body):
+    page = decoder.loads(body)
+    rows = []
+
+    # What get_tweets' buildTweet does with each record, as a
+    # dict like "before" rather than a Tweet (needs Django)
+    for record in decoder.decodePage(page):
+        author = record.author
+
+        rows.append({
+            "tweet_id": str(record.id),
+            "text": record.text,
+            "created_at": record.created_at,
+            "language": record.language,
+            "hashtags": ",".join(f"#{h}" for h in record.hashtags),
+            "mentions": ",".join(f"@{m}" for m in record.mentions),
+            "media": ",".join(record.media),
+            "retweet_count": record.retweet_count,
+            "reply_count": record.reply_count,
+            "like_count": record.like_count,
+            "quote_count": record.quote_count,
+            "author_username": author.username,
+            "author_bio": author.bio,
+            "author_name": author.name,
+            "author_followers_count": author.followers_count,
+            "reply_to": record.reply_to,
+            "retweet_to": record.retweet_to,
+            "quoted_tweet": record.quoted_tweet
+        })
+
+    return page.get("meta").get("next_token"), rows
+
+
+if __name__ == "__main__":
+    body = syntheticPage()
+    runs = 2000
+
+    print(f"JSON backend: {'orjson' if hasattr(decoder, 'orjson') else 'json'}")
+
+    for name, function in (("before", before), ("after", after)):
+        seconds = min(timeit.repeat(lambda: function(body), number=runs, repeat=3))
+        print(f"{name}: {seconds / runs * 1e6:.0f} us per 100-tweet page")
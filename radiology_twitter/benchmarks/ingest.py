@@ -0,0 +1,131 @@
+"""
+End to end ingest benchmark.
+
+Replays a synthetic cassette through `get_tweets` against a throwaway
+test database and reports pages/sec, tweets/sec, queries per page and
+peak RSS.
+
+    python benchmarks/ingest.py --pages=50
+    DB_ENGINE=django.db.backends.mysql DB_NAME=... python benchmarks/ingest.py
+
+Without DB_ENGINE set, a temporary SQLite database is used. With MySQL,
+a separate test database is created and dropped, as with manage.py test.
+--seen_filter stores the tweets with a fresh seen-tweet filter, to
+compare against a run without one. Extra arguments after `--` are
+passed to get_tweets.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get("DB_ENGINE"):
+    os.environ["DB_ENGINE"] = "django.db.backends.sqlite3"
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "radiology_twitter.settings")
+
+import django
+
+django.setup()
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings, setup_test_environment
+
+from twitter_client.models import Endpoint, Hashtag, Tweet
+from twitter_client.replay import syntheticCassette
+
+
+class QueryCounter:
+    """
+    Counts queries on every connection, including the
+    ones opened by get_tweets' worker threads
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        connection_created.connect(self.install)
+
+    def install(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+
+        return execute(sql, params, many, context)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--tweets_per_page", type=int, default=100)
+    parser.add_argument("--rate_limit_every", type=int, default=0)
+    parser.add_argument("--seen_filter", action="store_true")
+    parser.add_argument("command_args", nargs="*")
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    try:
+        call_command("loaddata", "endpoints", verbosity=0)
+        standard = Endpoint.objects.get(name="standard")
+        Hashtag.objects.create(name="radiology", endpoint=standard)
+        Hashtag.objects.create(name="xray", endpoint=standard)
+
+        cassette = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(cassette, "w") as f:
+            json.dump(syntheticCassette(args.pages, args.tweets_per_page, rate_limit_every=args.rate_limit_every), f)
+
+        # Tweet ingest only, comparable with earlier runs
+        command_args = [f"--replay={cassette}", "--skip_volumes"] + args.command_args
+
+        # An empty database fills a new filter as it goes
+        seen_filter = os.path.join(tempfile.mkdtemp(), "tweets.bloom") if args.seen_filter else ""
+
+        counter = QueryCounter()
+        connection.execute_wrappers.append(counter)
+
+        # get_tweets is chatty; keep the report readable
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+        start = time.perf_counter()
+
+        try:
+            with override_settings(SEEN_FILTER_PATH=seen_filter):
+                call_command("get_tweets", *command_args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        elapsed = time.perf_counter() - start
+        tweets = Tweet.objects.count()
+
+        print(f"pages:            {args.pages}")
+        print(f"seen filter:      {'on' if seen_filter else 'off'}")
+        print(f"tweets stored:    {tweets}")
+        print(f"seconds:          {elapsed:.2f}")
+        print(f"pages/sec:        {args.pages / elapsed:.1f}")
+        print(f"tweets/sec:       {tweets / elapsed:.0f}")
+        print(f"queries per page: {counter.count / args.pages:.1f}")
+        # ru_maxrss is in kilobytes on Linux
+        print(f"peak RSS:         {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -75,7 +75,7 @@ DATABASES = {
         "PORT": os.environ.get("DB_PORT"),
         "OPTIONS": {
             "charset": "utf8mb4"
-        },
+        } if os.environ.get("DB_ENGINE") == "django.db.backends.mysql" else {},
     }
 }
 
@@ -118,6 +118,35 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Export jobs
+# Finished exports are cached here and evicted least recently
+# downloaded first once they take up more than EXPORT_CACHE_MAX_BYTES
+# or haven't been downloaded for EXPORT_CACHE_MAX_AGE_DAYS.
+# EXPORT_WORKERS=0 builds exports within the request. Jobs that
+# report no progress for EXPORT_JOB_TIMEOUT seconds are run again.
+
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", BASE_DIR / "export_cache")
+
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+EXPORT_CACHE_MAX_AGE_DAYS = int(os.environ.get("EXPORT_CACHE_MAX_AGE_DAYS", 7))
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+
+EXPORT_JOB_TIMEOUT = int(os.environ.get("EXPORT_JOB_TIMEOUT", 30 * 60))
+
+# Seen-tweet filter
+# A Bloom filter of the stored tweet ids that saves the lookup of
+# tweets that are new. Every process storing tweets must share the
+# file. Unset, every tweet is looked up. Sized for
+# SEEN_FILTER_CAPACITY ids at SEEN_FILTER_ERROR_RATE false positives.
+
+SEEN_FILTER_PATH = os.environ.get("SEEN_FILTER_PATH", "")
+
+SEEN_FILTER_CAPACITY = int(os.environ.get("SEEN_FILTER_CAPACITY", 20_000_000))
+
+SEEN_FILTER_ERROR_RATE = float(os.environ.get("SEEN_FILTER_ERROR_RATE", 0.01))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
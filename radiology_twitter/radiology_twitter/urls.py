@@ -1,10 +1,19 @@
 from django.contrib import admin
 from django.urls import path
-from twitter_client.views import (hashtagsEditor, fullArchive, exportData)
+from twitter_client.views import (
+    hashtagsEditor, fullArchive, exportData,
+    searchJobs, cancelSearchJob,
+    exportJobs, exportJob, exportJobDownload
+)
 
 urlpatterns = [
     path('', hashtagsEditor),
     path('full-archive-search/', fullArchive, name='full-archive-search'),
+    path('search-jobs', searchJobs, name='search-jobs'),
+    path('search-jobs/<int:job_id>/cancel', cancelSearchJob, name='cancel-search-job'),
     path('export-data', exportData, name='export-data'),
+    path('export-jobs', exportJobs, name='export-jobs'),
+    path('export-jobs/<int:job_id>', exportJob, name='export-job'),
+    path('export-jobs/<int:job_id>/download', exportJobDownload, name='export-job-download'),
     path('admin/', admin.site.urls),
 ]
@@ -0,0 +1,102 @@
+from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from twitter_client.models import CrawlState
+from twitter_client.ratelimit import shareLimits
+from twitter_client.volumes import asDatetime
+
+
+def formatTime(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def planWindows(volumes, start_time, end_time, window_tweets):
+    """
+    Splits [start_time, end_time] into windows of roughly
+    `window_tweets` tweets each, using the counts in `volumes`
+    (Volume objects, possibly for several hashtags).
+
+    Returns a list of (start_time, end_time) timestamp pairs.
+    """
+    start = parse_datetime(start_time)
+    end = parse_datetime(end_time)
+
+    # Add up the counts of every hashtag per bucket
+    buckets = {}
+
+    for volume in volumes:
+        bucket = (asDatetime(volume.start_time), asDatetime(volume.end_time))
+        buckets[bucket] = buckets.get(bucket, 0) + volume.tweet_count
+
+    windows = []
+    window_start = start
+    total = 0
+
+    for (bucket_start, bucket_end), count in sorted(buckets.items()):
+        total += count
+
+        if total >= window_tweets and start < bucket_end < end:
+            windows.append((window_start, bucket_end))
+            window_start = bucket_end
+            total = 0
+
+    if window_start < end:
+        windows.append((window_start, end))
+
+    return [(formatTime(s), formatTime(e)) for s, e in windows]
+
+
+def shardWindows(windows, shard):
+    """
+    Picks this container's share of the windows. `shard` is
+    "K/N" i.e the Kth of N containers, counting from 0.
+    """
+    index, count = [int(x) for x in shard.split("/")]
+
+    return [w for i, w in enumerate(windows) if i % count == index]
+
+
+def initWorker(workers):
+    # Forked workers must not share the parent's DB connection,
+    # and split the API quota between them
+    connections.close_all()
+    shareLimits(workers)
+
+
+def runWindow(window, options):
+    """
+    Runs get_tweets for one window in a worker process and
+    returns the window's progress from its checkpoints
+    """
+    try:
+        started = timezone.now()
+
+        call_command(
+            'get_tweets',
+            endpoint="academic",
+            start_time=window[0],
+            end_time=window[1],
+            skip_volumes=True,
+            **options
+        )
+
+        # Only the gaps of a window that weren't harvested
+        # before are searched, each with its own checkpoint.
+        # Checkpoints of earlier runs aren't this run's progress.
+        states = CrawlState.objects.filter(
+            endpoint__name="academic",
+            start_time__gte=window[0],
+            end_time__lte=window[1],
+            updated_at__gte=started
+        )
+
+        return {
+            "pages": sum(s.pages for s in states),
+            "tweets": sum(s.tweets for s in states),
+            "completed": all(s.completed for s in states)
+        }
+
+    finally:
+        connections.close_all()
@@ -0,0 +1,73 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TwitterSession:
+    """
+    A pooled, keep-alive HTTP session shared by everything that
+    talks to the Twitter API during a run.
+
+    Connection resets and 5xx responses are retried with
+    exponential backoff. 429s are left to the rate limiter.
+    """
+
+    # Requests count against the API's quota
+    offline = False
+
+    def __init__(self, pool_size=10, retries=5, backoff_factor=1):
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"],
+            # Hand the last response back so callers
+            # can report the status code as before
+            raise_on_status=False
+        )
+
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate"
+        })
+
+    def get(self, url, params=None, headers=None):
+        return self.session.get(url, params=params, headers=headers)
+
+    def stats(self):
+        """
+        Returns {host: {"requests", "connections", "reused"}}
+        """
+        stats = {}
+
+        pools = self.adapter.poolmanager.pools
+
+        # The pool container only allows iterating over a copy of its keys
+        for key in pools.keys():
+            pool = pools.get(key)
+
+            if pool is None:
+                continue
+
+            host = stats.setdefault(pool.host, {"requests": 0, "connections": 0})
+            host["requests"] += pool.num_requests
+            host["connections"] += pool.num_connections
+
+        for host in stats.values():
+            host["reused"] = host["requests"] - host["connections"]
+
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,182 @@
+"""
+Parquet and Arrow IPC exports.
+
+Rows of an export queryset are turned into typed Arrow record batches
+(integers, UTC timestamps, dictionary encoded low-cardinality strings)
+and written out as the batches are built, so like the CSV export the
+file is streamed rather than built in memory. Needs pyarrow.
+"""
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Rows per record batch (and Parquet row group)
+BATCH_ROWS = 50000
+
+# Columns with few distinct values
+DICTIONARY_COLUMNS = {"language", "hashtag__name", "kind"}
+
+INTEGER_FIELDS = {
+    "AutoField", "BigAutoField", "SmallAutoField", "IntegerField", "BigIntegerField",
+    "SmallIntegerField", "PositiveIntegerField", "PositiveBigIntegerField", "PositiveSmallIntegerField"
+}
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow")
+}
+
+
+def columnField(queryset, column):
+    """
+    Returns the model field behind a column of a values() queryset,
+    which may be an annotation or follow relations (hashtag__name)
+    """
+    annotation = queryset.query.annotations.get(column)
+
+    if annotation is not None:
+        return annotation.output_field
+
+    model = queryset.model
+    parts = column.split("__")
+
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+
+    field = model._meta.get_field(parts[-1])
+
+    # Foreign keys hold the value of the field they point to
+    if field.is_relation:
+        field = field.target_field
+
+    return field
+
+
+def arrowType(column, field):
+    if column in DICTIONARY_COLUMNS:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+    internal_type = field.get_internal_type()
+
+    if internal_type in INTEGER_FIELDS:
+        return pyarrow.int64()
+    if internal_type == "DateTimeField":
+        return pyarrow.timestamp("us", tz="UTC")
+    if internal_type == "BooleanField":
+        return pyarrow.bool_()
+
+    return pyarrow.string()
+
+
+def exportSchema(headers, queryset):
+    return pyarrow.schema([
+        (column, arrowType(column, columnField(queryset, column)))
+        for column in headers
+    ])
+
+
+def dictionaryColumn(values, dictionary):
+    """
+    Encodes `values` against `dictionary` (value -> index), adding new
+    values at the end. Every batch of an export shares one dictionary
+    per column, as the Arrow file format only allows new values to be
+    appended (a delta), never a different dictionary.
+    """
+    indices = []
+
+    for value in values:
+        if value is None:
+            indices.append(None)
+        else:
+            indices.append(dictionary.setdefault(value, len(dictionary)))
+
+    return pyarrow.DictionaryArray.from_arrays(
+        pyarrow.array(indices, pyarrow.int32()),
+        pyarrow.array(list(dictionary), pyarrow.string())
+    )
+
+
+def recordBatch(schema, rows, dictionaries):
+    columns = []
+
+    for field in schema:
+        values = [row[field.name] for row in rows]
+
+        if pyarrow.types.is_dictionary(field.type):
+            column = dictionaryColumn(values, dictionaries.setdefault(field.name, {}))
+        else:
+            column = pyarrow.array(values, field.type)
+
+        columns.append(column)
+
+    return pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class ChunkSink:
+    """
+    A write-only file that hands what's written to it
+    back to the caller, for streaming the response
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def columnarChunks(headers, queryset, rows, file_format):
+    """
+    Yields the bytes of a Parquet or Arrow IPC file holding `rows`
+    (dicts from the values() `queryset`), one record batch at a time
+    """
+    schema = exportSchema(headers, queryset)
+    sink = ChunkSink()
+
+    if file_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="snappy")
+        write = writer.write_batch
+    else:
+        writer = pyarrow.ipc.new_file(
+            sink, schema, options=pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        )
+        write = writer.write_batch
+
+    dictionaries = {}
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == BATCH_ROWS:
+            write(recordBatch(schema, batch, dictionaries))
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        write(recordBatch(schema, batch, dictionaries))
+
+    writer.close()
+
+    yield sink.drain()
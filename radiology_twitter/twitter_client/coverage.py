@@ -0,0 +1,120 @@
+"""
+Time ranges already harvested by academic searches.
+
+Each hashtag keeps a set of fully harvested ranges (HarvestedRange
+rows, merged so they never overlap). Before an academic search,
+missingWindows subtracts them from the requested timespan so only the
+gaps are searched, and once a gap has been stored in full
+recordCoverage merges it into the set.
+"""
+import datetime
+
+from django.db import transaction
+
+from twitter_client.models import HarvestedRange
+
+
+# The UI searches whole days as 00:00:00 to 23:59:59, so
+# ranges this close together are treated as touching
+TOLERANCE = datetime.timedelta(seconds=1)
+
+
+def mergeIntervals(intervals):
+    """
+    Returns [(start, end), ...] sorted, with overlapping
+    and touching intervals merged into one
+    """
+    merged = []
+
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + TOLERANCE:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def subtractIntervals(start, end, intervals):
+    """
+    Returns the [(start, end), ...] parts of start..end
+    not covered by `intervals`
+    """
+    gaps = []
+
+    for covered_start, covered_end in mergeIntervals(intervals):
+        if covered_end + TOLERANCE <= start or covered_start >= end:
+            continue
+
+        if covered_start - TOLERANCE > start:
+            gaps.append((start, covered_start))
+
+        start = max(start, covered_end)
+
+    if start < end:
+        gaps.append((start, end))
+
+    return gaps
+
+
+def coveredRanges(hashtag, start, end, include_retweets, get_replies):
+    # A search with retweets or replies covers one without
+    ranges = HarvestedRange.objects.filter(
+        hashtag=hashtag, start_time__lte=end + TOLERANCE, end_time__gte=start - TOLERANCE
+    )
+
+    if include_retweets:
+        ranges = ranges.filter(include_retweets=True)
+    if get_replies:
+        ranges = ranges.filter(get_replies=True)
+
+    return list(ranges.values_list("start_time", "end_time"))
+
+
+def missingWindows(hashtags, start, end, include_retweets, get_replies):
+    """
+    Returns the [(start, end), ...] parts of start..end that
+    haven't been harvested for at least one of the hashtags
+    """
+    gaps = []
+
+    for hashtag in hashtags:
+        gaps.extend(subtractIntervals(
+            start, end, coveredRanges(hashtag, start, end, include_retweets, get_replies)
+        ))
+
+    # Hashtags searched together share a query, so
+    # a gap of any of them is searched for all
+    return mergeIntervals(gaps)
+
+
+def recordCoverage(hashtags, start, end, include_retweets, get_replies):
+    """
+    Merges start..end into the hashtags' harvested ranges
+    """
+    with transaction.atomic():
+        for hashtag in hashtags:
+            overlapping = HarvestedRange.objects.select_for_update().filter(
+                hashtag=hashtag,
+                include_retweets=include_retweets,
+                get_replies=get_replies,
+                start_time__lte=end + TOLERANCE,
+                end_time__gte=start - TOLERANCE
+            )
+
+            merged = mergeIntervals(
+                list(overlapping.values_list("start_time", "end_time")) + [(start, end)]
+            )
+
+            overlapping.delete()
+
+            HarvestedRange.objects.bulk_create([
+                HarvestedRange(
+                    hashtag=hashtag,
+                    start_time=range_start,
+                    end_time=range_end,
+                    include_retweets=include_retweets,
+                    get_replies=get_replies
+                )
+                for range_start, range_end in merged
+            ])
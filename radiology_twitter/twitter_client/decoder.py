@@ -0,0 +1,103 @@
+"""
+Turns raw search pages into compact tweet records in a single pass.
+
+orjson is used to parse response bodies when it's installed,
+otherwise the standard library's json module.
+"""
+try:
+    import orjson
+
+    def loads(body):
+        return orjson.loads(body)
+
+except ImportError:
+    import json
+
+    def loads(body):
+        return json.loads(body)
+
+
+class AuthorRecord:
+    __slots__ = (
+        "id", "username", "name", "bio",
+        "followers_count", "following_count", "tweet_count"
+    )
+
+    def __init__(self, user):
+        metrics = user.get("public_metrics") or {}
+
+        self.id = user.get("id")
+        self.username = user.get("username")
+        self.name = user.get("name")
+        self.bio = user.get("description")
+        self.followers_count = metrics.get("followers_count")
+        self.following_count = metrics.get("following_count")
+        self.tweet_count = metrics.get("tweet_count")
+
+
+class TweetRecord:
+    __slots__ = (
+        "id", "text", "created_at", "language", "conversation_id", "author",
+        "retweet_count", "reply_count", "like_count", "quote_count",
+        "hashtags", "mentions", "media",
+        "reply_to", "retweet_to", "quoted_tweet"
+    )
+
+    def __init__(self, tweet, authors, media):
+        metrics = tweet.get("public_metrics") or {}
+        entities = tweet.get("entities") or {}
+
+        self.id = tweet.get("id")
+        self.text = tweet.get("text")
+        self.created_at = str(tweet.get("created_at"))  # in UTC
+        self.language = tweet.get("lang")
+        self.conversation_id = tweet.get("conversation_id", self.id)
+        self.author = authors.get(tweet.get("author_id"))
+
+        self.retweet_count = metrics.get("retweet_count")
+        self.reply_count = metrics.get("reply_count")
+        self.like_count = metrics.get("like_count")
+        self.quote_count = metrics.get("quote_count")
+
+        # Tags without the leading #, as returned by the API
+        self.hashtags = [h.get("tag") for h in entities.get("hashtags", ())]
+        # Usernames without the leading @
+        self.mentions = [m.get("username") for m in entities.get("mentions", ())]
+        self.media = [
+            media.get(key, '')
+            for key in (tweet.get("attachments") or {}).get("media_keys", ())
+        ]
+
+        self.reply_to = None
+        self.retweet_to = None
+        self.quoted_tweet = None
+
+        for rt in tweet.get("referenced_tweets", ()):
+            kind = rt.get("type")
+
+            if kind == "retweeted":
+                self.retweet_to = rt.get("id")
+            elif kind == "replied_to":
+                self.reply_to = rt.get("id")
+            elif kind == "quoted_tweet":
+                self.quoted_tweet = rt.get("id")
+
+
+def decodePage(page):
+    """
+    Returns the page's tweets as TweetRecords with their author
+    and media urls resolved from the page's includes.
+
+    `page` may be a parsed dict or a raw response body.
+    """
+    if isinstance(page, (bytes, str)):
+        page = loads(page)
+
+    includes = page.get("includes") or {}
+
+    # The Twitter API V2 returns media and authors separately
+    # from the tweets. Index them once per page.
+    media = {m.get("media_key"): m.get("url", '') for m in includes.get("media", ())}
+    authors = {u.get("id"): AuthorRecord(u) for u in includes.get("users", ())}
+
+    return [TweetRecord(tweet, authors, media) for tweet in page.get("data", ())]
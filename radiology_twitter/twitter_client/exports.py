@@ -0,0 +1,394 @@
+"""
+Building exports, and export jobs.
+
+An export is a hashtag's tweets, entities or volumes written out as
+CSV, Parquet or Arrow, a chunk at a time. Export jobs build the file in
+the background and keep it in a disk cache keyed by the export's
+parameters and the hashtag's data watermark, so identical downloads
+are served from disk until new data comes in.
+"""
+import csv
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Max
+from django.utils import timezone
+
+from twitter_client import columnar
+from twitter_client.models import ExportJob, Tweet, TweetEntity, TweetHashtagMap, Volume
+
+
+class Echo:
+    # csv.writer writes each row to this and
+    # gets the formatted line straight back
+    def write(self, value):
+        return value
+
+
+def chunkQueryset(queryset, last=None, chunk_size=2000):
+    """
+    Returns the query for the chunk of rows after `last`. Chunks are
+    read in the order of the queryset's `export_pk` annotation, or the
+    primary key's if it has none.
+    """
+    if "export_pk" not in queryset.query.annotations:
+        queryset = queryset.annotate(export_pk=F("pk"))
+
+    queryset = queryset.order_by("export_pk")
+
+    if last is not None:
+        queryset = queryset.filter(export_pk__gt=last)
+
+    return queryset[:chunk_size]
+
+
+def iterateRows(queryset, chunk_size=2000):
+    """
+    Yields the rows of a values() queryset a chunk at a time.
+
+    Unordered querysets are read one query per chunk (see
+    chunkQueryset), because MySQL's driver buffers the whole result of
+    a query (even with .iterator()). Ordered ones (volumes) are small
+    enough for .iterator().
+    """
+    if queryset.ordered:
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+
+    last = None
+
+    while True:
+        rows = list(chunkQueryset(queryset, last, chunk_size))
+
+        yield from rows
+
+        if len(rows) < chunk_size:
+            break
+
+        last = rows[-1]["export_pk"]
+
+
+def csvLines(headers, rows):
+    writer = csv.writer(Echo())
+
+    # Write first row (Headers)
+    yield writer.writerow(headers)
+
+    lines = []
+
+    for row in rows:
+        lines.append(writer.writerow([row[field] for field in headers]))
+
+        if len(lines) == 1000:
+            yield "".join(lines)
+            lines = []
+
+    yield "".join(lines)
+
+
+def gzipChunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+    for chunk in chunks:
+        # Flushing sends each chunk out as soon as it's compressed
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+def volumesQueryset(hashtag):
+    volume_fields = ["hashtag__name", "start_time", "end_time", "tweet_count"]
+
+    queryset = Volume.objects.filter(
+        hashtag=hashtag
+    ).order_by("start_time").values(*volume_fields)
+
+    return (volume_fields, queryset)
+
+
+def entitiesQueryset(hashtag, fromdate, todate):
+    entity_fields = ["tweet__tweet_id", "kind", "value"]
+
+    queryset = TweetEntity.objects.filter(
+        tweet__tweethashtagmap__hashtag=hashtag,
+        tweet__created_at__range=(fromdate, todate)
+    ).values(*entity_fields)
+
+    return (entity_fields, queryset)
+
+
+def tweetsQueryset(hashtag, fromdate, todate):
+    fields = [f.attname for f in Tweet._meta.fields]
+
+    # Author details are joined back in under
+    # the column names the export always had
+    author_fields = {
+        "author_username": F("author__username"),
+        "author_bio": F("author__bio"),
+        "author_name": F("author__name"),
+        "author_followers_count": F("author__followers_count"),
+        "author_following_count": F("author__following_count"),
+        "author_tweet_count": F("author__tweet_count")
+    }
+
+    queryset = Tweet.objects.filter(
+        tweethashtagmap__hashtag=hashtag,
+        created_at__range=(fromdate, todate)
+    ).values(*fields, **author_fields).annotate(
+        # Chunks follow the (hashtag, tweet) index instead
+        # of sorting the hashtag's tweets by primary key
+        export_pk=F("tweethashtagmap__tweet")
+    )
+
+    # Keep the author columns where they used to be
+    position = fields.index("author_id") + 1
+    headers = fields[:position] + list(author_fields) + fields[position:]
+
+    return (headers, queryset)
+
+
+def exportQueryset(hashtag, download, fromdate, todate):
+    """
+    Returns (headers, queryset, filename) for a download
+    of tweets (the default), entities or volumes
+    """
+    if download == "volumes":
+        return volumesQueryset(hashtag) + (f"volumes_{hashtag.name}",)
+    elif download == "entities":
+        return entitiesQueryset(hashtag, fromdate, todate) + (f"entities_{hashtag.name}",)
+    else:
+        return tweetsQueryset(hashtag, fromdate, todate) + ("tweets",)
+
+
+def exportFormat(file_format, compress):
+    """
+    Returns the (content type, file extension) of an export
+    """
+    if file_format in columnar.FORMATS:
+        return columnar.FORMATS[file_format]
+    if compress:
+        return ("application/gzip", ".csv.gz")
+
+    return ("text/csv", ".csv")
+
+
+def exportChunks(headers, queryset, file_format, compress, rows=None):
+    """
+    Yields the export file of `queryset` in chunks of bytes
+    """
+    if rows is None:
+        rows = iterateRows(queryset)
+
+    if file_format in columnar.FORMATS:
+        return columnar.columnarChunks(headers, queryset, rows, file_format)
+
+    lines = csvLines(headers, rows)
+
+    if compress:
+        return gzipChunks(lines)
+
+    return (line.encode() for line in lines)
+
+
+# Export jobs
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def getExecutor():
+    global executor
+
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=settings.EXPORT_WORKERS)
+
+        return executor
+
+
+def dataWatermark(hashtag, download):
+    """
+    Returns a value that changes whenever data is added to a hashtag.
+    Both are answered from an index of (hashtag, ...).
+    """
+    if download == "volumes":
+        watermark = Volume.objects.filter(hashtag=hashtag).aggregate(Max("updated_at"))
+    else:
+        # The newest link, not the newest tweet: tweets that are
+        # already stored get linked to more hashtags later
+        watermark = TweetHashtagMap.objects.filter(hashtag=hashtag).aggregate(Max("id"))
+
+    return str(list(watermark.values())[0])
+
+
+def exportKey(hashtag, download, file_format, compress, fromdate, todate):
+    parameters = {
+        "hashtag": hashtag.id,
+        "download": download,
+        "format": file_format,
+        "compress": compress and file_format not in columnar.FORMATS,
+        # Volumes are exported whatever the dates
+        "fromdate": fromdate if download != "volumes" else None,
+        "todate": todate if download != "volumes" else None,
+        "watermark": dataWatermark(hashtag, download)
+    }
+
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+def lostExport(job):
+    """
+    Whether a pending or running job hasn't reported for
+    EXPORT_JOB_TIMEOUT seconds. Jobs run on a thread pool in the
+    web worker, so they're gone if the worker restarts.
+    """
+    last = job.heartbeat_at or job.created_at
+
+    return (timezone.now() - last).total_seconds() > settings.EXPORT_JOB_TIMEOUT
+
+
+def submitExport(hashtag, download, file_format, compress, fromdate, todate):
+    """
+    Returns the export job for these parameters. A finished export of
+    the same data is reused, as is one that's still being built.
+    """
+    key = exportKey(hashtag, download, file_format, compress, fromdate, todate)
+
+    job = ExportJob.objects.filter(key=key).exclude(
+        status__in=[ExportJob.FAILED, ExportJob.EXPIRED]
+    ).order_by("-id").first()
+
+    if job and job.status != ExportJob.DONE and lostExport(job):
+        ExportJob.objects.filter(id=job.id, status=job.status).update(
+            status=ExportJob.FAILED, error="The export stopped reporting progress and was submitted again"
+        )
+        job = None
+
+    if job and (job.status != ExportJob.DONE or os.path.exists(job.path)):
+        return job
+
+    job = ExportJob.objects.create(
+        key=key,
+        hashtag=hashtag,
+        download=download,
+        file_format=file_format,
+        compress=compress,
+        fromdate=fromdate,
+        todate=todate,
+        filename=exportQueryset(hashtag, download, fromdate, todate)[2] + exportFormat(file_format, compress)[1]
+    )
+
+    if settings.EXPORT_WORKERS > 0:
+        getExecutor().submit(runExportThread, job.id)
+    else:
+        runExport(job.id)
+        job.refresh_from_db()
+
+    return job
+
+
+def countRows(job_id, rows, every=30):
+    # Reports progress as rows are written, every `every` seconds,
+    # so a slow export isn't taken for one that was lost
+    count = 0
+    reported = time.monotonic()
+
+    for row in rows:
+        yield row
+        count += 1
+
+        if time.monotonic() - reported >= every:
+            ExportJob.objects.filter(id=job_id).update(rows=count, heartbeat_at=timezone.now())
+            reported = time.monotonic()
+
+    ExportJob.objects.filter(id=job_id).update(rows=count, heartbeat_at=timezone.now())
+
+
+def runExport(job_id):
+    job = ExportJob.objects.select_related("hashtag").get(id=job_id)
+
+    # It may have been given up on while it waited in the queue
+    if not ExportJob.objects.filter(id=job.id, status=ExportJob.PENDING).update(
+        status=ExportJob.RUNNING, heartbeat_at=timezone.now()
+    ):
+        return
+
+    if job.file_format in columnar.FORMATS and columnar.pyarrow is None:
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.FAILED, error="pyarrow must be installed for Parquet and Arrow exports"
+        )
+        return
+
+    os.makedirs(settings.EXPORT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(settings.EXPORT_CACHE_DIR, f"{job.id}_{job.key}{exportFormat(job.file_format, job.compress)[1]}")
+
+    try:
+        headers, queryset, filename = exportQueryset(job.hashtag, job.download, job.fromdate, job.todate)
+        chunks = exportChunks(
+            headers, queryset, job.file_format, job.compress, countRows(job.id, iterateRows(queryset))
+        )
+
+        # Written under a temporary name so a half
+        # written file is never served
+        with open(f"{path}.part", "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        os.replace(f"{path}.part", path)
+
+    except Exception as e:
+        with open("error.txt", "a") as f:
+            f.write(f'{datetime.datetime.now()}: Failed to export job {job.id}: {e}\n')
+
+        ExportJob.objects.filter(id=job.id).update(status=ExportJob.FAILED, error=str(e))
+        return
+
+    now = timezone.now()
+
+    ExportJob.objects.filter(id=job.id).update(
+        status=ExportJob.DONE, path=path, size=os.path.getsize(path), finished_at=now, accessed_at=now
+    )
+
+    evictCache()
+
+
+def runExportThread(job_id):
+    try:
+        runExport(job_id)
+    finally:
+        # Each worker thread gets its own DB connection
+        # which Django won't close for us
+        connection.close()
+
+
+def expireExport(job):
+    if job.path and os.path.exists(job.path):
+        os.remove(job.path)
+
+    ExportJob.objects.filter(id=job.id).update(status=ExportJob.EXPIRED, path=None)
+
+
+def evictCache():
+    """
+    Removes cached exports that haven't been downloaded for
+    EXPORT_CACHE_MAX_AGE_DAYS, then the least recently downloaded
+    ones until the cache fits in EXPORT_CACHE_MAX_BYTES
+    """
+    oldest = timezone.now() - datetime.timedelta(days=settings.EXPORT_CACHE_MAX_AGE_DAYS)
+    total = 0
+
+    for job in ExportJob.objects.filter(status=ExportJob.DONE).order_by("-accessed_at"):
+        total += job.size
+
+        if total > settings.EXPORT_CACHE_MAX_BYTES or job.accessed_at < oldest:
+            expireExport(job)
+            total -= job.size
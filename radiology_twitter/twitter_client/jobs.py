@@ -0,0 +1,82 @@
+"""
+Full archive searches run as jobs.
+
+The UI records a SearchJob and the run_jobs worker picks it up and
+runs get_tweets for it in a process of its own, so searches that take
+hours don't hold up the web server. get_tweets --job reports progress
+on the job and stops once it's cancelled.
+"""
+import datetime
+
+from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
+
+from twitter_client.backfill import initWorker
+from twitter_client.models import SearchJob
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def checkCancelled(job_id):
+    if SearchJob.objects.filter(id=job_id, cancel_requested=True).exists():
+        raise JobCancelled(f"Job {job_id} was cancelled")
+
+
+def claimJob():
+    """
+    Marks the oldest pending job as running and returns it, or None.
+    The conditional update keeps two workers from taking the same job.
+    """
+    for job in SearchJob.objects.filter(status=SearchJob.PENDING, cancel_requested=False).order_by("id")[:10]:
+        claimed = SearchJob.objects.filter(id=job.id, status=SearchJob.PENDING).update(
+            status=SearchJob.RUNNING, started_at=timezone.now()
+        )
+
+        if claimed:
+            return job
+
+    return None
+
+
+def runSearchJob(job_id, max_jobs):
+    """
+    Runs get_tweets for a job, in a worker process
+    """
+    initWorker(max_jobs)
+
+    job = SearchJob.objects.get(id=job_id)
+    status = SearchJob.DONE
+    error = None
+
+    try:
+        # A job that was interrupted continues from its checkpoints
+        call_command(
+            'get_tweets',
+            endpoint="academic",
+            start_time=job.start_time,
+            end_time=job.end_time,
+            get_replies=job.get_replies,
+            include_retweets=job.include_retweets,
+            resume=True,
+            job=job.id
+        )
+
+    except JobCancelled:
+        status = SearchJob.CANCELLED
+
+    except Exception as e:
+        status = SearchJob.FAILED
+        error = str(e)
+
+        with open("error.txt", "a") as f:
+            f.write(f'{datetime.datetime.now()}: Search job {job.id} failed: {e}\n')
+
+    finally:
+        SearchJob.objects.filter(id=job.id).update(
+            status=status, error=error, finished_at=timezone.now()
+        )
+
+        connections.close_all()
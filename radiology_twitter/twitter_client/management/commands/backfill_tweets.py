@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from twitter_client.backfill import planWindows, shardWindows, initWorker, runWindow
+from twitter_client.client import TwitterSession
+from twitter_client.models import Volume
+from twitter_client.volumes import countsWindow
+from twitter_client.management.commands.get_tweets import Command as GetTweetsCommand
+
+
+class Command(BaseCommand):
+    help = 'Backfills academic hashtags over a time range in parallel windows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start_time', type=str, required=True)
+        parser.add_argument('--end_time', type=str, required=True)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--window_tweets', type=int, default=50000)
+        parser.add_argument('--shard', type=str, default="0/1")
+        parser.add_argument('--get_replies', action='store_true')
+        parser.add_argument('--include_retweets', action='store_true')
+        parser.add_argument('--resume', action='store_true')
+
+    def getVolumes(self, start_time, end_time, include_retweets):
+        # Collecting the counts is part of an academic run
+        # anyway. Here they also size the windows.
+        command = GetTweetsCommand()
+        command.session = TwitterSession()
+
+        timespan = {"start_time": start_time, "end_time": end_time}
+        prefix = "" if include_retweets else "-is:retweet "
+
+        hashtags = command.getHashtags("academic")
+
+        # Only missing buckets are fetched, so
+        # plan with the stored counts as well
+        for hashtag in hashtags:
+            command.getTweetVolumes("academic", f"{prefix}#{hashtag.name}", timespan, hashtag)
+
+        command.session.close()
+
+        start, end = countsWindow("academic", timespan, Volume.HOUR)
+
+        return Volume.objects.filter(
+            hashtag__in=hashtags,
+            granularity=Volume.HOUR,
+            start_time__gte=start,
+            start_time__lt=end
+        )
+
+    def handle(self, *args, **options):
+        start_time = options['start_time']
+        end_time = options['end_time']
+        workers = max(1, options['workers'])
+
+        volumes = self.getVolumes(start_time, end_time, options['include_retweets'])
+        windows = planWindows(volumes, start_time, end_time, options['window_tweets'])
+        windows = shardWindows(windows, options['shard'])
+
+        print(f"Backfilling {len(windows)} windows with {workers} workers")
+
+        window_options = {
+            "get_replies": options['get_replies'],
+            "include_retweets": options['include_retweets'],
+            "resume": options['resume']
+        }
+
+        # Workers are forked and open their own DB connections
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(workers,)) as executor:
+            futures = {
+                executor.submit(runWindow, window, window_options): window
+                for window in windows
+            }
+
+            for future in as_completed(futures):
+                window = futures[future]
+
+                try:
+                    progress = future.result()
+                    status = "done" if progress["completed"] else "incomplete"
+                    print(f"{window[0]} - {window[1]}: {progress['pages']} pages, {progress['tweets']} tweets ({status})")
+
+                except Exception as e:
+                    print(f"{window[0]} - {window[1]}: failed ({e})")
+
+        print("\nDONE")
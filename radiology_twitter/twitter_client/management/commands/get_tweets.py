@@ -2,12 +2,15 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 import os
+import re
 from pathlib import Path
-import requests
-import time
 
 import csv
 
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+from django.db.models import F
+
 # for working with date and time
 import datetime
 
@@ -15,9 +18,22 @@ from googleapiclient.discovery import build
 from google.oauth2 import service_account
 
 from twitter_client.models import (
-    Hashtag, Tweet,
-    TweetHashtagMap, Volume
+    Endpoint, Hashtag, Tweet, Author,
+    Volume, Conversation,
+    CrawlState, SearchJob
 )
+from twitter_client.writer import saveTweets
+from twitter_client.ratelimit import getLimiter, getBudget
+from twitter_client.client import TwitterSession
+from twitter_client.replies import ReplyHarvester
+from twitter_client.decoder import decodePage, loads
+from twitter_client.spool import Spool
+from twitter_client.pipeline import PageWriter
+from twitter_client.replay import ReplaySession, RecordingSession
+from twitter_client.volumes import GRANULARITIES, asDatetime, countsWindow, missingRanges, saveVolumes
+from twitter_client.coverage import missingWindows, recordCoverage
+from twitter_client.backfill import formatTime
+from twitter_client.jobs import JobCancelled, checkCancelled
 
 
 class Command(BaseCommand):
@@ -26,7 +42,8 @@ class Command(BaseCommand):
     # The tweet attributes to be returned by the API
     tweet_fields = [
         'id', 'text', 'created_at', 'public_metrics', 'lang',
-        'referenced_tweets', 'entities', 'geo', 'attachments'
+        'referenced_tweets', 'entities', 'geo', 'attachments',
+        'conversation_id'
     ]
 
     media_fields = [
@@ -45,12 +62,57 @@ class Command(BaseCommand):
         'description'
     ]
 
+    # Maximum query length allowed by each search endpoint
+    query_limits = {
+        "standard": 512,
+        "academic": 1024
+    }
+
+    # Tweet counts endpoint of each search endpoint
+    counts_urls = {
+        "standard": "https://api.twitter.com/2/tweets/counts/recent",
+        "academic": "https://api.twitter.com/2/tweets/counts/all"
+    }
+
     def add_arguments(self, parser):
         parser.add_argument('--get_replies', action='store_true')
         parser.add_argument('--include_retweets', action='store_true')
         parser.add_argument('--endpoint', type=str, default='standard')
         parser.add_argument('--start_time', type=str)
         parser.add_argument('--end_time', type=str)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--pool_size', type=int, default=10)
+        parser.add_argument('--reply_concurrency', type=int, default=2)
+        parser.add_argument('--resume', action='store_true')
+        parser.add_argument('--skip_volumes', action='store_true')
+        parser.add_argument('--granularity', type=str, default=Volume.HOUR, choices=list(GRANULARITIES))
+        parser.add_argument('--spool', type=str)
+        parser.add_argument('--spool_compression', type=str, default='gzip', choices=['gzip', 'zstd'])
+        parser.add_argument('--spool_only', action='store_true')
+        parser.add_argument('--queue_size', type=int, default=20)
+        parser.add_argument('--batch_pages', type=int, default=10)
+        parser.add_argument('--batch_seconds', type=float, default=5)
+        parser.add_argument('--record', type=str)
+        parser.add_argument('--replay', type=str)
+        parser.add_argument('--author_snapshots', action='store_true')
+        parser.add_argument('--job', type=int)
+
+    session = None
+    replies = None
+    resume = False
+    include_retweets = False
+    spool = None
+    spool_only = False
+    writer = None
+    author_snapshots = False
+    job = None
+
+    def getSession(self):
+        # Keep-alive connections are reused across every request in the run
+        if self.session is None:
+            self.session = TwitterSession()
+
+        return self.session
 
     
     def getToken(self, endpoint):
@@ -64,7 +126,7 @@ class Command(BaseCommand):
         return (url, bearer_token)
 
 
-    def createPayloadAndHeaders(self, endpoint, query, hashtag, timespan=None):
+    def createPayloadAndHeaders(self, endpoint, query, hashtags, timespan=None):
         token = self.getToken(endpoint)
 
         headers = {
@@ -84,8 +146,10 @@ class Command(BaseCommand):
             payload['start_time'] = timespan.get('start_time')
             payload['end_time'] = timespan.get('end_time')
 
-        if endpoint == "standard" and hashtag.last_tweet:
-            payload['since_id'] = hashtag.last_tweet
+        # A batch can only resume from its oldest watermark.
+        # Tweets the other hashtags already have are skipped on write.
+        if endpoint == "standard" and hashtags and all(h.last_tweet for h in hashtags):
+            payload['since_id'] = min((h.last_tweet for h in hashtags), key=int)
 
         return (token[0], payload, headers)
 
@@ -93,192 +157,279 @@ class Command(BaseCommand):
     # This function will handle making requests,
     # paginating through responses and trying to
     # recover from rate limits
-    def paginate(self, url, payload, headers):
+    def paginate(self, url, payload, headers, endpoint="standard"):
         has_next_page = True
 
+        # Shared by all hashtags crawled concurrently on this endpoint
+        limiter = getLimiter(endpoint)
+        budget = getBudget(url)
+
+        # Replayed responses (--replay) aren't rate limited
+        offline = self.getSession().offline
+
         while has_next_page:
-            response = requests.get(
+            # Stop between requests once a job (--job) is cancelled
+            if self.job:
+                checkCancelled(self.job)
+
+            if not offline:
+                # Sleeps if the rate limit window is (nearly) used up
+                budget.wait()
+                limiter.acquire()
+
+            response = self.getSession().get(
                 url,
                 params=payload,
                 headers=headers
             )
 
+            budget.update(response.headers)
+
             if int(response.status_code) == 200:
-                next_token = response.json().get("meta").get("next_token")
+                # Parsed once, with orjson when it's installed
+                page = loads(response.content)
+                next_token = page.get("meta").get("next_token")
 
                 if next_token:
                     payload["next_token"] = next_token
                 else:
                     has_next_page = False
 
-                yield response.json()
+                yield page
 
             else:
-                if int(response.status_code) == 429:            
-                    # if we have reached the rate limit,
-                    # sleep for a minute then call function again
+                if int(response.status_code) == 429:
+                    # if we have reached the rate limit, retry the
+                    # same next_token once the window resets
                     print("Rate limit reached. Sleeping")
-                    time.sleep(60)
-                    print("Proceeding...")
-                    self.paginate(url, payload, headers)
+                    budget.exhausted()
 
                 else:
                     raise Exception(response.status_code, response.text)
 
 
-    def getReplies(self, endpoint, hashtag, tweet_id, author):
+    def getReplies(self, endpoint, query, conversations):
         try:
-            print(f"Getting replies for {tweet_id}")
-
-            query = f'conversation_id:{tweet_id} to:{author}'
+            print(f"Getting replies for {len(conversations)} conversations")
 
             """
                Query Explanation
 
                A tweet that's a reply will have a conversation id leading back to
-               the original tweet, and will be in reply to the user that published it
+               the original tweet, and will be in reply to the user that published it.
+               One query covers several tweets
+               i.e (conversation_id:1 to:a) OR (conversation_id:2 to:b)
             """
 
-            payload = self.createPayloadAndHeaders(endpoint, query, hashtag)
+            hashtags = list({h.id: h for hs in conversations.values() for h in hs}.values())
+
+            payload = self.createPayloadAndHeaders(endpoint, query, [])
+
+            # Replies rarely repeat the hashtag, so they are
+            # attributed to the same hashtags as their parent
+            for page in self.paginate(payload[0], payload[1], payload[2], endpoint):
+                self.processTweets(endpoint, hashtags, page, False, conversations)
+
+            # Queued after the reply pages, so it is only
+            # recorded once they have been written
+            self.write(
+                lambda: Conversation.objects.bulk_create(
+                    [Conversation(conversation_id=c) for c in conversations],
+                    ignore_conflicts=True
+                )
+            )
 
-            for page in self.paginate(payload[0], payload[1], payload[2]):
-                self.processTweets(endpoint, hashtag, page, True)
+        except JobCancelled:
+            raise
 
         except Exception as e:
+            self.replies.failed = True
+
             with open("error.txt", "a") as f:
-                f.write(f'{datetime.datetime.now()}: Failed to get replies for tweet with ID {tweet_id}: {e}\n')
+                f.write(f'{datetime.datetime.now()}: Failed to get replies for conversations {", ".join(conversations)}: {e}\n')
 
         return
 
-    """
-    The Twitter API V2 returns media in
-    an unorthodox way. Let's re-organize
-    the data for ease of querying
-    """
-    def organizeMedia(self, media_objects):
-        media_dict = {}
+    def buildAuthor(self, author):
+        return Author(
+            author_id = author.id,
+            username = author.username,
+            # Author url is given by;
+            # f"https://twitter.com/{{ author.username }}"
+            bio = author.bio,
+            name = author.name,
+            # Author metrics
+            followers_count = author.followers_count,
+            following_count = author.following_count,
+            tweet_count = author.tweet_count
+        )
+
+
+    def buildTweet(self, record):
+        return Tweet(
+            tweet_id = str(record.id),
+            text = record.text,
+            # Tweet url is given by;
+            # f"https://twitter.com/{{ to.author.username }}/status/{{ to.tweet_id }}"
+            created_at = record.created_at,  # in UTC
+            language = record.language,
+            mentions = ",".join(f"@{m}" for m in record.mentions),
+            hashtags = ",".join(f"#{h}" for h in record.hashtags),
+            media = ",".join(record.media),
+            # Tweet metrics
+            retweet_count = record.retweet_count,
+            reply_count = record.reply_count,
+            like_count = record.like_count,
+            quote_count = record.quote_count,
+            # Author details are upserted separately, see buildAuthor
+            author_id = record.author.id,
+            reply_to = record.reply_to,
+            retweet_to = record.retweet_to,
+            quoted_tweet = record.quoted_tweet
+        )
+
+
+    def matchHashtags(self, record, hashtags):
+        """
+        Returns the hashtags in `hashtags` that the tweet carries. A tweet
+        returned for an OR-query may match several of the batch's hashtags.
+        """
+        tags = {tag.lower() for tag in record.hashtags if tag}
+
+        matched = [h for h in hashtags if h.name.lstrip("#").lower() in tags]
+
+        # Entities can miss a tag the text still has
+        if not matched:
+            matched = [
+                h for h in hashtags
+                if re.search(rf'(?<!\w)#{re.escape(h.name.lstrip("#"))}(?!\w)', record.text or "", re.IGNORECASE)
+            ]
+
+        # The API matched the tweet on something we can't see
+        # (e.g a truncated retweet). Don't lose it, but note that
+        # it's linked to every hashtag of the query.
+        if not matched:
+            if len(hashtags) > 1:
+                with open("error.txt", "a") as f:
+                    f.write(
+                        f'{datetime.datetime.now()}: No hashtag of the query found in tweet {record.id}, '
+                        f'linked to all {len(hashtags)}\n'
+                    )
 
-        if media_objects:
-            for media in media_objects:
-                media_dict[media.get("media_key")] = media.get("url", '')
+            matched = list(hashtags)
 
-        return media_dict
+        return matched
 
 
-    def organizeAuthors(self, author_objects):
-        author_dict = {}
+    def buildRows(self, page, hashtags, conversations=None, get_replies=False):
+        """
+        Returns the page's tweets as (Tweet, [Hashtag, ...]) pairs and
+        their authors, for saveTweets. Replies are queued on the way
+        if asked to.
+        """
+        rows = []
+        authors = {}
 
-        if author_objects:
-            for author in author_objects:
-                author_dict[author.get("id")] = {
-                    "username": author.get("username"),
-                    "url": f"https://twitter.com/{author.get('username')}",
-                    "bio": author.get("description"),
-                    "name": author.get("name"),
-                    "metrics": author.get("public_metrics")
-                }
+        for record in decodePage(page):
+            print(record.id)
 
-        return author_dict
+            if conversations:
+                matched = conversations.get(record.conversation_id, hashtags)
+            else:
+                matched = self.matchHashtags(record, hashtags)
 
+            if get_replies:
+                if int(record.reply_count) > 0:
+                    # Searched later, in batches, by the reply harvester
+                    self.replies.add(str(record.id), record.author.id, matched)
 
-    def processTweets(self, endpoint, hashtag, page, get_replies):
-        try:
-            tweets = page.get("data", [])
-            media_objects = self.organizeMedia(page.get("includes", {}).get("media"))
-            author_objects = self.organizeAuthors(page.get("includes", {}).get("users"))
-
-            tweet_id = None
-
-            for tweet in tweets:
-                # Primary tweet attributes
-                tweet_id = tweet.get("id")
-                print(tweet_id)
-                text = tweet.get("text")
-                date = str(tweet.get("created_at"))
-
-                author = author_objects.get(tweet.get("author_id"))
-
-                # tweet metrics
-                metrics = tweet.get("public_metrics")
-
-                if get_replies:
-                    if int(metrics.get("reply_count")) > 0:
-                        self.getReplies(endpoint, hashtag, tweet_id, tweet.get("author_id"))
-
-                retweet_to = None
-                reply_to = None
-                quoted_tweet = None
-
-                referenced_tweets = tweet.get("referenced_tweets", [])
-
-                for rt in referenced_tweets:
-                    if rt.get("type") == "retweeted":
-                        retweet_to = rt.get("id")
-                    elif rt.get("type") == "replied_to":
-                        reply_to = rt.get("id")
-                    elif rt.get("type") == "quoted_tweet":
-                        quoted_tweet = rt.get("id")
-                    else:
-                        pass
-
-                entities = tweet.get("entities", {})
-
-                language = tweet.get("lang")
-
-                hashtags_list = entities.get("hashtags", [])
-                hashtags = [f'#{h.get("tag")}' for h in hashtags_list]
-
-                mentions_list = entities.get("mentions", [])
-                mentions = [f'@{m.get("username")}' for m in mentions_list]
-
-                media_ids = (tweet.get("attachments", {})).get("media_keys", [])
-                media = [media_objects.get(m) for m in media_ids]
-
-                # create a link to the tweet
-                url = f"https://twitter.com/{author.get('username')}/status/{tweet_id}"
-
-                tweet_instance = Tweet.objects.get_or_create(
-                    tweet_id = str(tweet_id),
-                    defaults={
-                        "text": text,
-                        # Tweet url is given by;
-                        # f"https://twitter.com/{{ to.author_username }}/status/{{ to.tweet_id }}"
-                        "created_at": date,  # in UTC
-                        "language": language,
-                        "mentions": ",".join(mentions),
-                        "hashtags": ",".join(hashtags),
-                        "media": ",".join(media),
-                        # Tweet metrics
-                        "retweet_count": metrics.get("retweet_count"),
-                        "reply_count": metrics.get("reply_count"),
-                        "like_count": metrics.get("like_count"),
-                        "quote_count": metrics.get("quote_count"),
-                        # No need to normalize author data because
-                        # we may potentially be dealing with big data.
-                        "author_id": tweet.get("author_id"),
-                        "author_username": author.get("username"),
-                        # Author url is given by;
-                        # f"https://twitter.com/{{ to.author_username }}"
-                        "author_bio": author.get("bio"),
-                        "author_name": author.get("name"),
-                        # Author metrics
-                        "author_followers_count": author.get("metrics").get("followers_count"),
-                        "author_following_count": author.get("metrics").get("following_count"),
-                        "author_tweet_count": author.get("metrics").get("tweet_count"),
-                        "reply_to": reply_to,
-                        "retweet_to": retweet_to,
-                        "quoted_tweet": quoted_tweet
-                    }
-                )
+            rows.append((self.buildTweet(record), matched))
 
-                TweetHashtagMap.objects.get_or_create(
-                    tweet=tweet_instance[0],
-                    hashtag=hashtag
-                )
+            if record.author.id not in authors:
+                authors[record.author.id] = self.buildAuthor(record.author)
+
+        return rows, list(authors.values())
+
+
+    def spoolPage(self, kind, page, hashtags, conversations=None, granularity=None):
+        if self.spool:
+            self.spool.write({
+                "kind": kind,
+                "hashtags": [h.id for h in hashtags],
+                "conversations": {
+                    c: [h.id for h in hs] for c, hs in conversations.items()
+                } if conversations else None,
+                "granularity": granularity,
+                "page": page
+            })
+
+
+    def write(self, write):
+        """
+        Hands a database write to the page writer thread, or
+        runs it in its own transaction when there isn't one
+        """
+        if self.writer:
+            self.writer.submit(write)
+        else:
+            with transaction.atomic():
+                write()
 
-            if tweet_id:
-                hashtag.last_tweet=tweet_id
-                hashtag.save()
+
+    def commitPage(self, rows, authors, hashtags, meta, conversations=None, state=None, number=None):
+        # The page and its checkpoint are committed together
+        if self.spool_only:
+            # load_tweets writes the tweets later
+            counts = {"inserted": 0, "skipped": 0}
+        else:
+            counts = saveTweets(rows, authors, self.author_snapshots)
+
+        if state:
+            counters = {
+                "tweets": F("tweets") + counts["inserted"],
+                "duplicates": F("duplicates") + counts["skipped"],
+                # update() doesn't set auto_now fields
+                "updated_at": timezone.now()
+            }
+
+            checkpoint = {
+                "next_token": meta.get("next_token"),
+                "pages": F("pages") + 1,
+                **counters
+            }
+
+            # Empty pages have no ids
+            if meta.get("oldest_id"):
+                checkpoint["oldest_id"] = meta["oldest_id"]
+
+            # Only moves on from the page before it. Once a page has
+            # failed, the checkpoint stays in front of it, so --resume
+            # searches it again and the search can't be completed.
+            moved = CrawlState.objects.filter(id=state.id, pages=number - 1).update(**checkpoint)
+
+            if not moved:
+                CrawlState.objects.filter(id=state.id).update(**counters)
+
+        if self.job:
+            SearchJob.objects.filter(id=self.job).update(
+                pages=F("pages") + 1,
+                tweets=F("tweets") + counts["inserted"]
+            )
+
+        print(f"Inserted {counts['inserted']} tweets, skipped {counts['skipped']} existing")
+
+
+    def processTweets(self, endpoint, hashtags, page, get_replies, conversations=None, state=None, number=None):
+        # Spooled first, so the page survives a failed write below
+        self.spoolPage("tweets", page, hashtags, conversations)
+
+        try:
+            rows, authors = self.buildRows(page, hashtags, conversations, get_replies)
+            meta = page.get("meta", {})
+
+            self.write(
+                lambda: self.commitPage(rows, authors, hashtags, meta, conversations, state, number)
+            )
 
             return 1  # Just return something to differentiate success and failure
 
@@ -289,47 +440,201 @@ class Command(BaseCommand):
                 return None
 
 
-    def getTweets(self, endpoint, query, timespan, hashtag, get_replies=False):
-        payload = self.createPayloadAndHeaders(endpoint, query, hashtag, timespan)
+    def getCrawlState(self, endpoint, query, timespan, hashtags, payload):
+        """
+        Returns the checkpoint for this search. With --resume, an
+        unfinished search continues from its last committed page.
+        """
+        timespan = timespan or {}
+
+        state = CrawlState.objects.filter(
+            query=query,
+            endpoint__name=endpoint,
+            start_time=timespan.get("start_time"),
+            end_time=timespan.get("end_time")
+        ).order_by("-updated_at").first()
+
+        if self.resume and state and not state.completed and (state.oldest_id or state.next_token):
+            print(f"Resuming {query} after {state.pages} pages")
+            CrawlState.objects.filter(id=state.id).update(updated_at=timezone.now())
+
+            # Everything newer than the oldest committed tweet
+            # is stored, so continue with the tweets before it
+            if state.oldest_id:
+                payload["until_id"] = state.oldest_id
+            else:
+                payload["next_token"] = state.next_token
+
+            if state.since_id:
+                payload["since_id"] = state.since_id
+            else:
+                payload.pop("since_id", None)
+
+            return state
+
+        if state is None:
+            state = CrawlState.objects.create(
+                query=query,
+                endpoint=Endpoint.objects.get(name=endpoint),
+                start_time=timespan.get("start_time"),
+                end_time=timespan.get("end_time"),
+                since_id=payload.get("since_id")
+            )
+            state.hashtags.set(hashtags)
+        else:
+            state.since_id = payload.get("since_id")
+            state.next_token = None
+            state.newest_id = None
+            state.oldest_id = None
+            state.pages = 0
+            state.tweets = 0
+            state.duplicates = 0
+            state.avoided = 0
+            state.completed = False
+            state.save()
+
+        return state
+
+
+    def getTweets(self, endpoint, query, timespan, hashtags, get_replies=False):
+        payload = self.createPayloadAndHeaders(endpoint, query, hashtags, timespan)
         # This returns (url, payload, headers)
 
-        for page in self.paginate(payload[0], payload[1], payload[2]):
-            self.processTweets(endpoint, hashtag, page, get_replies)
+        state = self.getCrawlState(endpoint, query, timespan, hashtags, payload[1])
+
+        if self.job:
+            SearchJob.objects.filter(id=self.job).update(
+                current_query=query,
+                current_start=(timespan or {}).get("start_time"),
+                current_end=(timespan or {}).get("end_time")
+            )
+
+        # Pages a complete search will have committed
+        pages = state.pages
+        newest_id = state.newest_id
+
+        for page in self.paginate(payload[0], payload[1], payload[2], endpoint):
+            pages += 1
+
+            # Results come newest first, so this is the first page's
+            page_newest = page.get("meta", {}).get("newest_id")
+
+            if page_newest and (newest_id is None or int(page_newest) > int(newest_id)):
+                newest_id = page_newest
+                self.write(
+                    lambda newest_id=newest_id: CrawlState.objects.filter(id=state.id).update(newest_id=newest_id)
+                )
+
+            self.processTweets(endpoint, hashtags, page, get_replies, state=state, number=pages)
+
+        # Queued after the pages, so it runs once they're written
+        self.write(
+            lambda: self.completeCrawl(state, hashtags, pages, newest_id, payload[1].get("since_id"), get_replies)
+        )
+
+
+    def completeCrawl(self, state, hashtags, pages, newest_id, since_id, get_replies=False):
+        """
+        Marks a search complete and moves its hashtags' since_id up to
+        the newest tweet it returned, but only if every page was
+        committed. Otherwise the next run searches the same range again.
+        """
+        completed = CrawlState.objects.filter(id=state.id, pages=pages).update(
+            completed=True, next_token=None, updated_at=timezone.now()
+        )
+
+        if not completed:
+            print(f"Not every page of {state.query} was stored. Keeping the watermark")
+            return
+
+        if newest_id:
+            for hashtag in Hashtag.objects.filter(id__in=[h.id for h in hashtags]):
+                # Backfills of older ranges mustn't move it back
+                if hashtag.last_tweet is None or int(newest_id) > int(hashtag.last_tweet):
+                    Hashtag.objects.filter(id=hashtag.id).update(last_tweet=newest_id)
+
+        # Spooled pages aren't stored until load_tweets runs
+        if state.endpoint.name == "academic" and state.start_time and not self.spool_only:
+            start, end = asDatetime(state.start_time), asDatetime(state.end_time)
+            recordCoverage(hashtags, start, end, self.include_retweets, False)
+
+            # Replies are searched later, so the range only
+            # counts as harvested with replies once they are
+            if get_replies:
+                self.reply_coverage.append((hashtags, start, end))
+
+        avoided = 0
+
+        # Stored tweets of the last 7 days that since_id kept out of the results
+        if since_id and state.endpoint.name == "standard":
+            watermark = Tweet.objects.filter(tweet_id=since_id).values_list("id", flat=True).first()
+
+            if watermark:
+                avoided = Tweet.objects.filter(
+                    tweethashtagmap__hashtag__in=hashtags,
+                    id__lte=watermark,
+                    created_at__gte=timezone.now() - datetime.timedelta(days=7)
+                ).distinct().count()
+
+        CrawlState.objects.filter(id=state.id).update(avoided=avoided)
+        state.refresh_from_db()
+
+        print(
+            f"{state.query}: inserted {state.tweets} tweets, skipped {state.duplicates} "
+            f"already stored, since_id avoided {state.avoided}"
+        )
 
     
-    def getTweetVolumes(self, endpoint, query, timespan, hashtag):
-        bearer_token = os.environ.get('ACADEMIC_BEARER_TOKEN')
+    def buildVolumes(self, page, hashtag, granularity=Volume.HOUR):
+        volume_objects = []
+
+        for x in page.get("data", []):
+            volume_objects.append(
+                Volume(
+                    hashtag=hashtag,
+                    granularity=granularity,
+                    start_time=x.get("start"),
+                    end_time=x.get("end"),
+                    tweet_count=x.get("tweet_count")
+                )
+            )
+
+        return volume_objects
+
+
+    def getTweetVolumes(self, endpoint, query, timespan, hashtag, granularity=Volume.HOUR):
+        bearer_token = self.getToken(endpoint)[1]
+        url = self.counts_urls[endpoint]
 
         headers = {
             "Authorization": f"Bearer {bearer_token}"
         }
 
-        payload = {
-            "query": query,
-        }
+        # Only the buckets we don't have yet are requested
+        start, end = countsWindow(endpoint, timespan, granularity)
+        ranges = missingRanges(hashtag, granularity, start, end)
 
-        if timespan:
-            payload['start_time'] = timespan.get('start_time')
-            payload['end_time'] = timespan.get('end_time')
+        volumes = []
 
-        url = 'https://api.twitter.com/2/tweets/counts/all'
+        for range_start, range_end in ranges:
+            payload = {
+                "query": query,
+                "granularity": granularity,
+                "start_time": formatTime(range_start),
+                "end_time": formatTime(range_end)
+            }
 
-        for page in self.paginate(url, payload, headers):
-            volume_objects = []
+            for page in self.paginate(url, payload, headers, endpoint):
+                self.spoolPage("volumes", page, [hashtag], granularity=granularity)
 
-            for x in page.get("data", []):
-                volume_objects.append(
-                    Volume(
-                        hashtag=hashtag,
-                        start_time=x.get("start"),
-                        end_time=x.get("end"),
-                        tweet_count=x.get("tweet_count")
-                    )
-                )
+                volume_objects = self.buildVolumes(page, hashtag, granularity)
 
-            Volume.objects.bulk_create(volume_objects)
+                if not self.spool_only:
+                    self.write(lambda objects=volume_objects: saveVolumes(objects))
 
-        return
+                volumes.extend(volume_objects)
+
+        return volumes
 
 
     def getHashtags(self, endpoint):
@@ -346,31 +651,188 @@ class Command(BaseCommand):
 
         return hashtags
 
+    def batchHashtags(self, endpoint, hashtags, include_retweets):
+        """
+        Packs hashtags into as few `(#a OR #b ...)` queries as the
+        endpoint's query length limit allows.
+
+        Returns a list of (query, [hashtags]) pairs.
+        """
+        prefix = "" if include_retweets else "-is:retweet "
+        limit = self.query_limits.get(endpoint, self.query_limits["standard"])
+
+        def buildQuery(batch):
+            terms = " OR ".join(f"#{h.name}" for h in batch)
+
+            if len(batch) > 1:
+                terms = f"({terms})"
+
+            return f"{prefix}{terms}"
+
+        batches = []
+        batch = []
+
+        for hashtag in hashtags:
+            if batch and len(buildQuery(batch + [hashtag])) > limit:
+                batches.append(batch)
+                batch = []
+
+            batch.append(hashtag)
+
+        if batch:
+            batches.append(batch)
+
+        return [(buildQuery(batch), batch) for batch in batches]
+
+
+    def searchWindows(self, endpoint, hashtags, timespan, get_replies):
+        """
+        Returns the timespans to search. Academic searches skip
+        the ranges earlier runs harvested for all the hashtags.
+        """
+        if endpoint != "academic" or not timespan:
+            return [timespan]
+
+        start = asDatetime(timespan["start_time"])
+        end = asDatetime(timespan["end_time"])
+        gaps = missingWindows(hashtags, start, end, self.include_retweets, get_replies)
+
+        if gaps != [(start, end)]:
+            print(f"{len(gaps)} gaps left to search between {timespan['start_time']} and {timespan['end_time']}")
+
+        return [
+            {"start_time": formatTime(gap_start), "end_time": formatTime(gap_end)}
+            for gap_start, gap_end in gaps
+        ]
+
+
+    def crawlHashtags(self, endpoint, query, hashtags, timespan, get_replies, include_retweets,
+                      skip_volumes=False, granularity=Volume.HOUR):
+        try:
+            for window in self.searchWindows(endpoint, hashtags, timespan, get_replies):
+                print(f"Querying Twitter for {query}")
+                self.getTweets(endpoint, query, window, hashtags, get_replies)
+
+            # Counts can't be split per hashtag locally,
+            # so volumes are still queried one by one
+            if not skip_volumes:
+                for hashtag in hashtags:
+                    prefix = "" if include_retweets else "-is:retweet "
+
+                    try:
+                        self.getTweetVolumes(endpoint, f"{prefix}#{hashtag.name}", timespan, hashtag, granularity)
+
+                    except JobCancelled:
+                        raise
+
+                    except Exception as e:
+                        # The tweets are stored already, so
+                        # don't fail the run over the counts
+                        with open("error.txt", "a") as f:
+                            f.write(f'{datetime.datetime.now()}: Failed to get volumes for #{hashtag.name}: {e}\n')
+
+        finally:
+            # Each worker thread gets its own DB connection
+            # which Django won't close for us
+            connection.close()
+
+
     def handle(self, *args, **options):
         endpoint = options['endpoint']
         get_replies = options['get_replies']
         include_retweets = options['include_retweets']
+        self.resume = options['resume']
+        self.include_retweets = include_retweets
+        # (hashtags, start, end) of academic ranges waiting on their replies
+        self.reply_coverage = []
+        skip_volumes = options['skip_volumes']
+        granularity = options['granularity']
+        self.author_snapshots = options['author_snapshots']
+        self.job = options['job']
+
+        if options['spool']:
+            self.spool = Spool(options['spool'], options['spool_compression'])
+            self.spool_only = options['spool_only']
+        concurrency = max(1, options['concurrency'])
+
+        # Every worker thread needs its own connection from the pool
+        pool_size = max(options['pool_size'], concurrency + options['reply_concurrency'])
+
+        if options['replay']:
+            self.session = ReplaySession.load(options['replay'])
+        elif options['record']:
+            self.session = RecordingSession(options['record'], pool_size=pool_size)
+        else:
+            self.session = TwitterSession(pool_size=pool_size)
 
         start_time = options['start_time']
         end_time = options['end_time']
 
-        hashtags = self.getHashtags(endpoint)
+        if start_time and end_time:
+            timespan = {"start_time": start_time, "end_time": end_time}
+        else:
+            timespan = None
 
-        for hashtag in hashtags:
-            if include_retweets:
-                query = f"#{hashtag.name}"
-            else:
-                query = f"-is:retweet #{hashtag.name}"
+        # Pages are written on a separate thread while the next ones
+        # are fetched. --queue_size=0 writes each page before moving on.
+        if options['queue_size'] > 0:
+            self.writer = PageWriter(
+                options['queue_size'], max(1, options['batch_pages']), options['batch_seconds']
+            )
 
-            if start_time and end_time:
-                timespan = {"start_time": start_time, "end_time": end_time}
-            else:
-                timespan = None
+        if get_replies:
+            self.replies = ReplyHarvester(self, endpoint, options['reply_concurrency'])
+
+        try:
+            hashtags = self.getHashtags(endpoint)
+            batches = self.batchHashtags(endpoint, hashtags, include_retweets)
 
-            print(f"Querying Twitter for #{hashtag.name}")
-            self.getTweets(endpoint, query, timespan, hashtag, get_replies)
+            if concurrency == 1:
+                for query, batch in batches:
+                    self.crawlHashtags(
+                        endpoint, query, batch, timespan, get_replies, include_retweets, skip_volumes, granularity
+                    )
+            else:
+                # Crawls are mostly spent waiting on the network. All
+                # workers share the endpoint's rate limiter in paginate.
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    futures = [
+                        executor.submit(
+                            self.crawlHashtags,
+                            endpoint, query, batch, timespan, get_replies, include_retweets, skip_volumes, granularity
+                        )
+                        for query, batch in batches
+                    ]
+
+                    for future in futures:
+                        future.result()
+
+            if self.replies:
+                self.replies.finish()
+
+                if not self.replies.failed:
+                    for covered in self.reply_coverage:
+                        self.write(
+                            lambda covered=covered: recordCoverage(*covered, self.include_retweets, True)
+                        )
+
+        finally:
+            # Reply searches still queued when the crawl failed would
+            # keep calling the API and writing to a closed writer
+            if self.replies:
+                self.replies.cancel()
+
+            # Flush everything still queued before returning,
+            # even if the crawl was interrupted
+            if self.writer:
+                self.writer.close()
+
+            if self.spool:
+                self.spool.close()
+
+        for host, stats in self.session.stats().items():
+            print(f"{host}: {stats['requests']} requests over {stats['connections']} connections")
+
+        self.session.close()
 
-            if endpoint == "academic":
-                self.getTweetVolumes(endpoint, query, timespan, hashtag)
-        
         print("\nDONE")
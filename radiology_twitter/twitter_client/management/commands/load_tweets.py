@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+
+import os
+
+# for working with date and time
+import datetime
+
+from twitter_client.models import Hashtag, Volume
+from twitter_client.spool import spoolFiles, readSpool
+from twitter_client.writer import saveTweets
+from twitter_client.volumes import saveVolumes
+from twitter_client.management.commands.get_tweets import Command as GetTweetsCommand
+
+
+class Command(BaseCommand):
+    help = 'Loads spooled API pages written by get_tweets --spool into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=str)
+        parser.add_argument('--batch_pages', type=int, default=10)
+        parser.add_argument('--keep', action='store_true')
+
+    def loadFile(self, path, batch_pages):
+        # Reuses get_tweets' page to Tweet mapping
+        builder = GetTweetsCommand()
+        hashtags = Hashtag.objects.in_bulk()
+
+        rows = []
+        authors = []
+        pages = 0
+        counts = {"inserted": 0, "skipped": 0, "volumes": 0}
+
+        def flush():
+            result = saveTweets(rows, authors)
+            counts["inserted"] += result["inserted"]
+            counts["skipped"] += result["skipped"]
+            rows.clear()
+            authors.clear()
+
+        for record in readSpool(path):
+            page_hashtags = [hashtags[h] for h in record["hashtags"] if h in hashtags]
+
+            if record["kind"] == "volumes":
+                # The hashtag has been deleted since
+                if not page_hashtags:
+                    continue
+
+                granularity = record.get("granularity") or Volume.HOUR
+                volume_objects = builder.buildVolumes(record["page"], page_hashtags[0], granularity)
+                counts["volumes"] += saveVolumes(volume_objects)
+                continue
+
+            conversations = None
+
+            if record["conversations"]:
+                conversations = {
+                    c: [hashtags[h] for h in ids if h in hashtags]
+                    for c, ids in record["conversations"].items()
+                }
+
+            page_rows, page_authors = builder.buildRows(record["page"], page_hashtags, conversations)
+            rows.extend(page_rows)
+            authors.extend(page_authors)
+            pages += 1
+
+            # Several pages per transaction
+            if pages % batch_pages == 0:
+                flush()
+
+        flush()
+
+        return counts
+
+    def handle(self, *args, **options):
+        for path in spoolFiles(options['paths']):
+            print(f"Loading {path}")
+
+            try:
+                counts = self.loadFile(path, max(1, options['batch_pages']))
+
+            except Exception as e:
+                # Leave the file where it is so the load can be retried
+                with open("error.txt", "a") as f:
+                    f.write(f'{datetime.datetime.now()}: Failed to load {path}: {e}\n')
+
+                continue
+
+            print(f"Inserted {counts['inserted']} tweets, skipped {counts['skipped']} existing, {counts['volumes']} volumes")
+
+            if not options['keep']:
+                os.rename(path, f"{path}.loaded")
+
+        print("\nDONE")
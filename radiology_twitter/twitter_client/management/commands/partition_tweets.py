@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# for working with date and time
+import datetime
+
+from twitter_client import partitions
+
+
+class Command(BaseCommand):
+    help = 'Manages monthly partitions of the tweet table (MySQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enable', action='store_true')
+        parser.add_argument('--roll', action='store_true')
+        parser.add_argument('--months_ahead', type=int, default=3)
+        parser.add_argument('--drop_before', type=str)
+        parser.add_argument('--archive_before', type=str)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "mysql":
+            raise CommandError("Tweet partitioning is only supported on MySQL")
+
+        with connection.cursor() as cursor:
+            existing = partitions.existingPartitions(cursor)
+
+            if options['enable']:
+                if existing:
+                    raise CommandError("The tweet table is already partitioned")
+
+                created = partitions.enablePartitioning(cursor, options['months_ahead'])
+                print(f"Partitioned the tweet table into {len(created)} monthly partitions")
+
+            elif not existing:
+                raise CommandError("The tweet table isn't partitioned. Run with --enable first")
+
+            if options['roll']:
+                created = partitions.rollPartitions(cursor, options['months_ahead'])
+                print(f"Added partitions: {', '.join(created) or 'none'}")
+
+            # Dates are given as YYYY-MM
+            if options['archive_before']:
+                before = datetime.datetime.strptime(options['archive_before'], "%Y-%m").date()
+                archived = partitions.archivePartitions(cursor, before)
+                print(f"Archived partitions: {', '.join(archived) or 'none'}")
+
+            if options['drop_before']:
+                before = datetime.datetime.strptime(options['drop_before'], "%Y-%m").date()
+                dropped = partitions.dropPartitions(cursor, before)
+                print(f"Dropped partitions: {', '.join(dropped) or 'none'}")
+
+            print(f"Partitions: {', '.join(partitions.existingPartitions(cursor))}")
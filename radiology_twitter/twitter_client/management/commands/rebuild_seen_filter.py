@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from twitter_client.models import Tweet
+from twitter_client.seen import rebuildFilter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the seen-tweet filter from the stored tweets'
+
+    def add_arguments(self, parser):
+        # Defaults to twice the stored tweets, so it has room to grow
+        parser.add_argument('--capacity', type=int)
+        parser.add_argument('--error_rate', type=float, default=settings.SEEN_FILTER_ERROR_RATE)
+
+    def handle(self, *args, **options):
+        path = settings.SEEN_FILTER_PATH
+
+        if not path:
+            raise CommandError("SEEN_FILTER_PATH isn't set")
+
+        capacity = options['capacity'] or max(settings.SEEN_FILTER_CAPACITY, 2 * Tweet.objects.count())
+
+        print(f"Building {path} for {capacity} tweets")
+
+        added = rebuildFilter(path, capacity, options['error_rate'])
+
+        print(f"Added {added} tweets")
+        print("\nDONE")
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+import multiprocessing
+import time
+
+from twitter_client.jobs import claimJob, runSearchJob
+from twitter_client.models import SearchJob
+
+
+class Command(BaseCommand):
+    help = 'Runs the full archive search jobs submitted from the UI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max_jobs', type=int, default=1)
+        parser.add_argument('--poll_seconds', type=float, default=5)
+        # How long a cancelled job gets to stop by itself
+        parser.add_argument('--cancel_seconds', type=float, default=60)
+        parser.add_argument('--once', action='store_true')
+
+    def reap(self, processes, cancelling, cancel_seconds):
+        for job_id, process in list(processes.items()):
+            if not process.is_alive():
+                process.join()
+                del processes[job_id]
+                cancelling.pop(job_id, None)
+
+                # The job records its own outcome unless its process died
+                SearchJob.objects.filter(id=job_id, status=SearchJob.RUNNING).update(
+                    status=SearchJob.FAILED,
+                    error=f"The job's process exited with code {process.exitcode}",
+                    finished_at=timezone.now()
+                )
+
+                print(f"Job {job_id} finished")
+
+        # A job stops between requests when it's cancelled, but it
+        # can be sleeping out a rate limit window for much longer
+        cancelled = SearchJob.objects.filter(
+            id__in=list(processes), cancel_requested=True
+        ).values_list("id", flat=True)
+
+        for job_id in cancelled:
+            since = cancelling.setdefault(job_id, time.monotonic())
+
+            if time.monotonic() - since > cancel_seconds:
+                processes[job_id].terminate()
+
+                SearchJob.objects.filter(id=job_id).update(
+                    status=SearchJob.CANCELLED, finished_at=timezone.now()
+                )
+
+                print(f"Job {job_id} terminated")
+
+    def handle(self, *args, **options):
+        max_jobs = max(1, options['max_jobs'])
+        processes = {}
+        cancelling = {}
+
+        # Jobs left running by a previous worker are run
+        # again, continuing from their checkpoints
+        SearchJob.objects.filter(status=SearchJob.RUNNING).update(status=SearchJob.PENDING)
+
+        print(f"Running up to {max_jobs} jobs at a time")
+
+        while True:
+            self.reap(processes, cancelling, options['cancel_seconds'])
+
+            SearchJob.objects.filter(status=SearchJob.PENDING, cancel_requested=True).update(
+                status=SearchJob.CANCELLED, finished_at=timezone.now()
+            )
+
+            while len(processes) < max_jobs:
+                job = claimJob()
+
+                if job is None:
+                    break
+
+                print(f"Starting job {job.id}: {job.start_time} to {job.end_time}")
+
+                # The job's process must not share our DB connection
+                connections.close_all()
+
+                process = multiprocessing.Process(target=runSearchJob, args=(job.id, max_jobs))
+                process.start()
+                processes[job.id] = process
+
+            if options['once'] and not processes:
+                break
+
+            time.sleep(options['poll_seconds'])
+
+        print("\nDONE")
@@ -0,0 +1,189 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+
+# for working with date and time
+import datetime
+import time
+
+from twitter_client.client import TwitterSession
+from twitter_client.models import HashtagSchedule, TweetHashtagMap
+from twitter_client.ratelimit import budgetState
+from twitter_client.replay import ReplaySession
+from twitter_client.replies import ReplyHarvester
+from twitter_client.scheduler import observedRate, volumeRate, budgetStretch, nextInterval
+from twitter_client.management.commands.get_tweets import Command as GetTweetsCommand
+
+
+class Command(BaseCommand):
+    help = 'Keeps polling the standard hashtags, each on an interval fitted to its tweet rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--get_replies', action='store_true')
+        parser.add_argument('--include_retweets', action='store_true')
+        # About how many new tweets each poll should find
+        parser.add_argument('--target_tweets', type=int, default=500)
+        parser.add_argument('--min_interval', type=int, default=5 * 60)
+        # Well within the 7 days the recent search covers
+        parser.add_argument('--max_interval', type=int, default=24 * 3600)
+        parser.add_argument('--volume_interval', type=int, default=3600)
+        parser.add_argument('--pool_size', type=int, default=10)
+        parser.add_argument('--reply_concurrency', type=int, default=2)
+        parser.add_argument('--replay', type=str)
+        parser.add_argument('--once', action='store_true')
+
+    def pollVolumes(self, crawler, hashtags, prefix, now, volume_interval):
+        for schedule in hashtags:
+            polled = schedule.volumes_polled_at
+
+            if polled and (now - polled).total_seconds() < volume_interval:
+                continue
+
+            try:
+                crawler.getTweetVolumes("standard", f"{prefix}#{schedule.hashtag.name}", None, schedule.hashtag)
+                schedule.volumes_polled_at = now
+
+            except Exception as e:
+                with open("error.txt", "a") as f:
+                    f.write(f'{datetime.datetime.now()}: Failed to get volumes for #{schedule.hashtag.name}: {e}\n')
+
+    def poll(self, crawler, options):
+        """
+        Polls every hashtag that is due and schedules its next poll
+        """
+        now = timezone.now()
+        include_retweets = options['include_retweets']
+        prefix = "" if include_retweets else "-is:retweet "
+
+        hashtags = crawler.getHashtags("standard")
+
+        # New hashtags are polled straight away
+        for hashtag in hashtags:
+            HashtagSchedule.objects.get_or_create(hashtag=hashtag, defaults={"next_poll_at": now})
+
+        due = list(
+            HashtagSchedule.objects.filter(
+                hashtag__in=hashtags, next_poll_at__lte=now
+            ).select_related("hashtag")
+        )
+
+        if not due:
+            return
+
+        # Links created from here on are this poll's new tweets
+        mark = TweetHashtagMap.objects.aggregate(Max("id"))["id__max"] or 0
+
+        if options['get_replies']:
+            crawler.replies = ReplyHarvester(crawler, "standard", options['reply_concurrency'])
+
+        # Hashtags that are due together share OR-queries
+        for query, batch in crawler.batchHashtags("standard", [s.hashtag for s in due], include_retweets):
+            try:
+                print(f"Querying Twitter for {query}")
+                crawler.getTweets("standard", query, None, batch, options['get_replies'])
+
+            except Exception as e:
+                with open("error.txt", "a") as f:
+                    f.write(f'{datetime.datetime.now()}: Failed to poll {query}: {e}\n')
+
+        if crawler.replies:
+            try:
+                crawler.replies.finish()
+            finally:
+                crawler.replies = None
+
+        self.pollVolumes(crawler, due, prefix, now, options['volume_interval'])
+
+        found = dict(
+            TweetHashtagMap.objects.filter(
+                id__gt=mark, hashtag__in=[s.hashtag for s in due]
+            ).values_list("hashtag").annotate(Count("id"))
+        )
+
+        stretch = budgetStretch(budgetState().get(crawler.getToken("standard")[0]))
+
+        for schedule in due:
+            tweets = found.get(schedule.hashtag.id, 0)
+
+            try:
+                if schedule.last_polled_at:
+                    elapsed = (now - schedule.last_polled_at).total_seconds()
+                    rate = observedRate(schedule.tweet_rate, tweets, elapsed)
+                else:
+                    # The first poll reaches back 7 days, so
+                    # go by the counts until there's a second
+                    rate = volumeRate(schedule.hashtag, now)
+
+                schedule.tweet_rate = rate
+                schedule.interval = nextInterval(
+                    rate, stretch, options['target_tweets'], options['min_interval'], options['max_interval']
+                )
+                schedule.last_polled_at = now
+                schedule.next_poll_at = now + datetime.timedelta(seconds=schedule.interval)
+                schedule.save()
+
+            except Exception as e:
+                # The other hashtags still get their next poll
+                with open("error.txt", "a") as f:
+                    f.write(f'{datetime.datetime.now()}: Failed to schedule #{schedule.hashtag.name}: {e}\n')
+
+                continue
+
+            print(f"#{schedule.hashtag.name}: {tweets} new tweets, next poll in {schedule.interval}s")
+
+    def secondsToNextPoll(self, most=60):
+        # Wake up at least every `most` seconds to pick up new hashtags
+        earliest = HashtagSchedule.objects.filter(
+            hashtag__enabled=True, hashtag__endpoint__name="standard"
+        ).order_by("next_poll_at").values_list("next_poll_at", flat=True).first()
+
+        if earliest is None:
+            return most
+
+        return min(most, max(0, (earliest - timezone.now()).total_seconds()))
+
+    def handle(self, *args, **options):
+        # One crawler, and so one HTTP connection pool,
+        # for as long as the scheduler runs
+        crawler = GetTweetsCommand()
+
+        if options['replay']:
+            crawler.session = ReplaySession.load(options['replay'])
+        else:
+            crawler.session = TwitterSession(pool_size=options['pool_size'])
+
+        try:
+            while True:
+                try:
+                    self.poll(crawler, options)
+
+                    if options['once']:
+                        break
+
+                    wait = self.secondsToNextPoll()
+
+                except Exception as e:
+                    # A poll that failed (e.g the database went away)
+                    # mustn't stop the scheduler. Its hashtags are
+                    # still due, so they are polled again.
+                    with open("error.txt", "a") as f:
+                        f.write(f'{datetime.datetime.now()}: Failed to poll: {e}\n')
+
+                    # Django reconnects on the next query
+                    connection.close()
+
+                    if options['once']:
+                        break
+
+                    wait = 60
+
+                time.sleep(wait)
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            crawler.session.close()
+
+        print("\nDONE")
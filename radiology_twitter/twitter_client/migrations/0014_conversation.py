@@ -0,0 +1,21 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0013_hashtag_last_tweet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.CharField(max_length=50, unique=True)),
+                ('harvested_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0014_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=1024)),
+                ('start_time', models.CharField(max_length=30, null=True)),
+                ('end_time', models.CharField(max_length=30, null=True)),
+                ('since_id', models.CharField(max_length=50, null=True)),
+                ('next_token', models.CharField(max_length=200, null=True)),
+                ('pages', models.IntegerField(default=0)),
+                ('tweets', models.IntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('endpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.endpoint')),
+                ('hashtags', models.ManyToManyField(to='twitter_client.Hashtag')),
+            ],
+        ),
+    ]
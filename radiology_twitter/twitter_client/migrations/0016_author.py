@@ -0,0 +1,110 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populateAuthors(apps, schema_editor):
+    Author = apps.get_model('twitter_client', 'Author')
+    Tweet = apps.get_model('twitter_client', 'Tweet')
+
+    # Keep the details from each author's latest tweet
+    tweets = Tweet.objects.order_by('author_id', '-created_at').values(
+        'author_id', 'author_username', 'author_bio', 'author_name',
+        'author_followers_count', 'author_following_count', 'author_tweet_count'
+    )
+
+    authors = []
+    last_author = None
+
+    for tweet in tweets.iterator():
+        if tweet['author_id'] == last_author:
+            continue
+
+        last_author = tweet['author_id']
+
+        authors.append(
+            Author(
+                author_id=tweet['author_id'],
+                username=tweet['author_username'],
+                bio=tweet['author_bio'],
+                name=tweet['author_name'],
+                followers_count=tweet['author_followers_count'],
+                following_count=tweet['author_following_count'],
+                tweet_count=tweet['author_tweet_count']
+            )
+        )
+
+        if len(authors) >= 1000:
+            Author.objects.bulk_create(authors)
+            authors = []
+
+    Author.objects.bulk_create(authors)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0015_crawlstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('author_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=30)),
+                ('bio', models.CharField(max_length=1000)),
+                ('name', models.CharField(max_length=200)),
+                ('followers_count', models.IntegerField()),
+                ('following_count', models.IntegerField()),
+                ('tweet_count', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuthorSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('captured_at', models.DateTimeField(auto_now_add=True)),
+                ('followers_count', models.IntegerField()),
+                ('following_count', models.IntegerField()),
+                ('tweet_count', models.IntegerField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.author')),
+            ],
+        ),
+        migrations.RunPython(populateAuthors, migrations.RunPython.noop),
+        # The column keeps its name and values; it
+        # only becomes a foreign key to Author
+        migrations.RenameField(
+            model_name='tweet',
+            old_name='author_id',
+            new_name='author',
+        ),
+        migrations.AlterField(
+            model_name='tweet',
+            name='author',
+            field=models.ForeignKey(db_column='author_id', on_delete=django.db.models.deletion.CASCADE, to='twitter_client.author'),
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_bio',
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_followers_count',
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_following_count',
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_name',
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_tweet_count',
+        ),
+        migrations.RemoveField(
+            model_name='tweet',
+            name='author_username',
+        ),
+    ]
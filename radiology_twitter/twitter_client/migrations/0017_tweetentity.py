@@ -0,0 +1,56 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populateEntities(apps, schema_editor):
+    Tweet = apps.get_model('twitter_client', 'Tweet')
+    TweetEntity = apps.get_model('twitter_client', 'TweetEntity')
+
+    entities = []
+
+    tweets = Tweet.objects.values_list('id', 'hashtags', 'mentions', 'media')
+
+    for tweet_id, hashtags, mentions, media in tweets.iterator():
+        values = set()
+
+        for kind, joined, prefix in (('hashtag', hashtags, '#'), ('mention', mentions, '@'), ('media', media, None)):
+            for value in (joined or '').split(','):
+                if prefix:
+                    value = value.lstrip(prefix).lower()
+
+                if value:
+                    values.add((kind, value[:500]))
+
+        entities.extend(TweetEntity(tweet_id=tweet_id, kind=k, value=v) for k, v in values)
+
+        if len(entities) >= 5000:
+            TweetEntity.objects.bulk_create(entities)
+            entities = []
+
+    TweetEntity.objects.bulk_create(entities)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0016_author'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetEntity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hashtag', 'Hashtag'), ('mention', 'Mention'), ('media', 'Media')], max_length=10)),
+                ('value', models.CharField(max_length=500)),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.tweet')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tweetentity',
+            index=models.Index(fields=['kind', 'value'], name='tweetentity_kind_value'),
+        ),
+        migrations.RunPython(populateEntities, migrations.RunPython.noop),
+    ]
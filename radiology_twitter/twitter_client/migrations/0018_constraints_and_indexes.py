@@ -0,0 +1,70 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:34
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def removeDuplicates(apps, schema_editor):
+    Hashtag = apps.get_model('twitter_client', 'Hashtag')
+    TweetHashtagMap = apps.get_model('twitter_client', 'TweetHashtagMap')
+    Volume = apps.get_model('twitter_client', 'Volume')
+    CrawlState = apps.get_model('twitter_client', 'CrawlState')
+
+    # Merge duplicate hashtags into the oldest one
+    duplicates = Hashtag.objects.values('name', 'endpoint').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for duplicate in duplicates:
+        others = Hashtag.objects.filter(
+            name=duplicate['name'], endpoint=duplicate['endpoint']
+        ).exclude(id=duplicate['keep'])
+
+        TweetHashtagMap.objects.filter(hashtag__in=others).update(hashtag_id=duplicate['keep'])
+        Volume.objects.filter(hashtag__in=others).update(hashtag_id=duplicate['keep'])
+
+        for state in CrawlState.objects.filter(hashtags__in=others).distinct():
+            state.hashtags.add(duplicate['keep'])
+
+        others.delete()
+
+    # Then drop repeated tweet to hashtag links
+    duplicates = TweetHashtagMap.objects.values('tweet', 'hashtag').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for duplicate in duplicates:
+        TweetHashtagMap.objects.filter(
+            tweet=duplicate['tweet'], hashtag=duplicate['hashtag']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0017_tweetentity'),
+    ]
+
+    operations = [
+        migrations.RunPython(removeDuplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['created_at'], name='tweet_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='tweethashtagmap',
+            index=models.Index(fields=['hashtag', 'tweet'], name='tweethashtagmap_hashtag_tweet'),
+        ),
+        migrations.AddIndex(
+            model_name='volume',
+            index=models.Index(fields=['hashtag', 'start_time'], name='volume_hashtag_start_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='hashtag',
+            constraint=models.UniqueConstraint(fields=('name', 'endpoint'), name='unique_hashtag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tweethashtagmap',
+            constraint=models.UniqueConstraint(fields=('tweet', 'hashtag'), name='unique_tweet_hashtag'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:38
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def removeDuplicates(apps, schema_editor):
+    Volume = apps.get_model('twitter_client', 'Volume')
+
+    # Reruns stored every bucket again. Keep the latest count.
+    duplicates = Volume.objects.values('hashtag', 'granularity', 'start_time').annotate(
+        keep=Max('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for duplicate in duplicates:
+        Volume.objects.filter(
+            hashtag=duplicate['hashtag'],
+            granularity=duplicate['granularity'],
+            start_time=duplicate['start_time']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0018_constraints_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='granularity',
+            field=models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], default='hour', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='volume',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(removeDuplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='volume',
+            constraint=models.UniqueConstraint(fields=('hashtag', 'granularity', 'start_time'), name='unique_volume'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0019_volume_granularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('download', models.CharField(max_length=20)),
+                ('file_format', models.CharField(max_length=10)),
+                ('compress', models.BooleanField(default=False)),
+                ('fromdate', models.CharField(max_length=30, null=True)),
+                ('todate', models.CharField(max_length=30, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('expired', 'Expired')], default='pending', max_length=10)),
+                ('rows', models.IntegerField(default=0)),
+                ('error', models.TextField(null=True)),
+                ('filename', models.CharField(max_length=200)),
+                ('path', models.CharField(max_length=500, null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('accessed_at', models.DateTimeField(null=True)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.hashtag')),
+            ],
+        ),
+    ]
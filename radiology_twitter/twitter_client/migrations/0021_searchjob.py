@@ -0,0 +1,32 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0020_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.CharField(max_length=30)),
+                ('end_time', models.CharField(max_length=30)),
+                ('get_replies', models.BooleanField(default=False)),
+                ('include_retweets', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=10)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('error', models.TextField(null=True)),
+                ('pages', models.IntegerField(default=0)),
+                ('tweets', models.IntegerField(default=0)),
+                ('current_query', models.CharField(max_length=1024, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
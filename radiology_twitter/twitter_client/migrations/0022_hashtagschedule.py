@@ -0,0 +1,26 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0021_searchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashtagSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.IntegerField(default=3600)),
+                ('tweet_rate', models.FloatField(null=True)),
+                ('next_poll_at', models.DateTimeField()),
+                ('last_polled_at', models.DateTimeField(null=True)),
+                ('volumes_polled_at', models.DateTimeField(null=True)),
+                ('hashtag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.hashtag')),
+            ],
+        ),
+    ]
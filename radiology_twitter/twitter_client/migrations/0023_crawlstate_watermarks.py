@@ -0,0 +1,33 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0022_hashtagschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlstate',
+            name='avoided',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crawlstate',
+            name='duplicates',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crawlstate',
+            name='newest_id',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlstate',
+            name='oldest_id',
+            field=models.CharField(max_length=50, null=True),
+        ),
+    ]
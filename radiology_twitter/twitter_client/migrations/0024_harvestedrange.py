@@ -0,0 +1,29 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0023_crawlstate_watermarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HarvestedRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('include_retweets', models.BooleanField(default=False)),
+                ('get_replies', models.BooleanField(default=False)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='twitter_client.hashtag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='harvestedrange',
+            index=models.Index(fields=['hashtag', 'start_time'], name='harvested_hashtag_start_time'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def removeDuplicates(apps, schema_editor):
+    TweetEntity = apps.get_model('twitter_client', 'TweetEntity')
+
+    # Tweets another writer stored first got their entities twice
+    duplicates = TweetEntity.objects.values('tweet', 'kind', 'value').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for duplicate in duplicates:
+        TweetEntity.objects.filter(
+            tweet=duplicate['tweet'],
+            kind=duplicate['kind'],
+            value=duplicate['value']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0024_harvestedrange'),
+    ]
+
+    operations = [
+        migrations.RunPython(removeDuplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tweetentity',
+            constraint=models.UniqueConstraint(fields=('tweet', 'kind', 'value'), name='unique_tweet_entity'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0025_unique_tweet_entity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
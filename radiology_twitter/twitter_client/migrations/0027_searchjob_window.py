@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter_client', '0026_exportjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='current_end',
+            field=models.CharField(max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='current_start',
+            field=models.CharField(max_length=30, null=True),
+        ),
+    ]
@@ -21,18 +21,47 @@ class Hashtag(models.Model):
     # only for hashtags in the "standard" endpoint. We'll use
     # this as the `since_id`
 
-    class meta:
-        UniqueConstraint(fields = ['name', 'endpoint'], name = 'unique_hashtag')
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields = ['name', 'endpoint'], name = 'unique_hashtag')
+        ]
 
     def __str__(self):
         return f"# {str(self.name)}"
 
 
+class Author(models.Model):
+    # The twitter user id
+    author_id = models.CharField(max_length=50, primary_key=True)
+    username = models.CharField(max_length=30)
+    # Author url is given by;
+    # f"https://twitter.com/{{ author.username }}"
+    bio = models.CharField(max_length=1000)
+    name = models.CharField(max_length=200)
+
+    # Latest known metrics. See AuthorSnapshot for their history
+    followers_count = models.IntegerField()
+    following_count = models.IntegerField()
+    tweet_count = models.IntegerField()
+
+    def __str__(self):
+        return self.username
+
+
+class AuthorSnapshot(models.Model):
+    # Only recorded with get_tweets --author_snapshots
+    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+    captured_at = models.DateTimeField(auto_now_add=True)
+    followers_count = models.IntegerField()
+    following_count = models.IntegerField()
+    tweet_count = models.IntegerField()
+
+
 class Tweet(models.Model):
     tweet_id = models.CharField(max_length=50, unique=True)
     text = models.CharField(max_length=1000)
     # Tweet url is given by;
-    # f"https://twitter.com/{{ to.author_username }}/status/{{ to.tweet_id }}"
+    # f"https://twitter.com/{{ to.author.username }}/status/{{ to.tweet_id }}"
     created_at = models.DateTimeField()  # in UTC
     language = models.CharField(max_length=10)
 
@@ -46,38 +75,246 @@ class Tweet(models.Model):
     like_count = models.IntegerField()
     quote_count = models.IntegerField()
 
-    # No need to normalize author data because
-    # we may potentially be dealing with big data.
-    author_id = models.CharField(max_length=50)
-    author_username = models.CharField(max_length=30)
-    # Author url is given by;
-    # f"https://twitter.com/{{ to.author_username }}"
-    author_bio = models.CharField(max_length=1000)
-    author_name = models.CharField(max_length=200)
-
-    # Author metrics
-    author_followers_count = models.IntegerField()
-    author_following_count = models.IntegerField()
-    author_tweet_count = models.IntegerField()
+    # Author data is stored once per author rather than
+    # repeated on every tweet. The column holds the twitter user id.
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, db_column="author_id")
 
     reply_to = models.CharField(max_length=50, default=None, null=True)
     retweet_to = models.CharField(max_length=50, default=None, null=True)
     quoted_tweet = models.CharField(max_length=50, default=None, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields = ['created_at'], name = 'tweet_created_at')
+        ]
+
     def __str__(self):
         return self.tweet_id
 
 
+class TweetEntity(models.Model):
+    # Indexed copies of the hashtags, mentions and media urls in
+    # Tweet.hashtags, Tweet.mentions and Tweet.media, one per row.
+    # Hashtags and mentions are stored lowercase without # or @.
+    HASHTAG = "hashtag"
+    MENTION = "mention"
+    MEDIA = "media"
+
+    KINDS = [
+        (HASHTAG, "Hashtag"),
+        (MENTION, "Mention"),
+        (MEDIA, "Media")
+    ]
+
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    value = models.CharField(max_length=500)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "value"], name="tweetentity_kind_value")
+        ]
+        constraints = [
+            UniqueConstraint(fields = ['tweet', 'kind', 'value'], name = 'unique_tweet_entity')
+        ]
+
+
 class TweetHashtagMap(models.Model):
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
     hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
 
-    class meta:
-        UniqueConstraint(fields = ['tweet', 'hashtag'], name = 'unique_hashtag')
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields = ['tweet', 'hashtag'], name = 'unique_tweet_hashtag')
+        ]
+        indexes = [
+            # Exports look up a hashtag's tweets
+            models.Index(fields = ['hashtag', 'tweet'], name = 'tweethashtagmap_hashtag_tweet')
+        ]
 
 
 class Volume(models.Model):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+    GRANULARITY_CHOICES = [
+        (MINUTE, "Minute"),
+        (HOUR, "Hour"),
+        (DAY, "Day")
+    ]
+
     hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    # The counts endpoints default to hourly buckets
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES, default=HOUR)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     tweet_count = models.IntegerField()
+
+    # A bucket that hadn't ended when it was
+    # fetched is fetched again on the next run
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['hashtag', 'start_time'], name = 'volume_hashtag_start_time')
+        ]
+        constraints = [
+            models.UniqueConstraint(fields = ['hashtag', 'granularity', 'start_time'], name = 'unique_volume')
+        ]
+
+
+class Conversation(models.Model):
+    # Conversations whose replies have already been harvested,
+    # so later runs don't search them again
+    conversation_id = models.CharField(max_length=50, unique=True)
+    harvested_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.conversation_id
+
+
+class CrawlState(models.Model):
+    # Checkpoint of one search so that an interrupted
+    # run can continue from where it stopped (--resume)
+    query = models.CharField(max_length=1024)
+    endpoint = models.ForeignKey(Endpoint, on_delete=models.CASCADE)
+    hashtags = models.ManyToManyField(Hashtag)
+    start_time = models.CharField(max_length=30, null=True)
+    end_time = models.CharField(max_length=30, null=True)
+
+    # The since_id the search started with. A next_token is
+    # only valid with the parameters it was issued for.
+    since_id = models.CharField(max_length=50, null=True)
+    next_token = models.CharField(max_length=200, null=True)
+
+    # The newest tweet of the search (from the first page's meta), and
+    # the oldest one committed so far, up to the first page that failed.
+    # Results come newest first, so an interrupted search continues with
+    # until_id=oldest_id. The newest becomes the hashtags' since_id once
+    # every page is committed.
+    newest_id = models.CharField(max_length=50, null=True)
+    oldest_id = models.CharField(max_length=50, null=True)
+
+    pages = models.IntegerField(default=0)
+    tweets = models.IntegerField(default=0)
+    # Tweets returned that were already stored
+    duplicates = models.IntegerField(default=0)
+    # Stored tweets since_id kept the search from returning again
+    avoided = models.IntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.query} ({self.start_time} - {self.end_time})"
+
+
+class ExportJob(models.Model):
+    # An export built in the background. The finished file is
+    # cached on disk and served to every identical request
+    # until the hashtag's data changes or it's evicted.
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    EXPIRED = "expired"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+        (EXPIRED, "Expired")
+    ]
+
+    # Hash of the export parameters and the data watermark
+    key = models.CharField(max_length=64, db_index=True)
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    download = models.CharField(max_length=20)
+    file_format = models.CharField(max_length=10)
+    compress = models.BooleanField(default=False)
+    fromdate = models.CharField(max_length=30, null=True)
+    todate = models.CharField(max_length=30, null=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    rows = models.IntegerField(default=0)
+    error = models.TextField(null=True)
+
+    filename = models.CharField(max_length=200)
+    path = models.CharField(max_length=500, null=True)
+    size = models.BigIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Updated as rows are written. Jobs that stop reporting were lost
+    # with their worker (e.g. on a restart) and are submitted again.
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # For evicting the least recently downloaded files first
+    accessed_at = models.DateTimeField(null=True)
+
+
+class SearchJob(models.Model):
+    # A full archive search submitted from the UI and
+    # run by the run_jobs worker, outside the web server
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+        (CANCELLED, "Cancelled")
+    ]
+
+    start_time = models.CharField(max_length=30)
+    end_time = models.CharField(max_length=30)
+    get_replies = models.BooleanField(default=False)
+    include_retweets = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    cancel_requested = models.BooleanField(default=False)
+    error = models.TextField(null=True)
+
+    # Progress, updated by get_tweets as pages are committed
+    pages = models.IntegerField(default=0)
+    tweets = models.IntegerField(default=0)
+    current_query = models.CharField(max_length=1024, null=True)
+    # The part of the range being searched, which is one of the
+    # gaps earlier runs left when parts were harvested already
+    current_start = models.CharField(max_length=30, null=True)
+    current_end = models.CharField(max_length=30, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+
+class HashtagSchedule(models.Model):
+    # When run_scheduler polls a hashtag next, and
+    # what the interval was worked out from
+    hashtag = models.OneToOneField(Hashtag, on_delete=models.CASCADE)
+    interval = models.IntegerField(default=3600)  # seconds
+    # Smoothed tweets per second seen by recent polls
+    tweet_rate = models.FloatField(null=True)
+    next_poll_at = models.DateTimeField()
+    last_polled_at = models.DateTimeField(null=True)
+    volumes_polled_at = models.DateTimeField(null=True)
+
+
+class HarvestedRange(models.Model):
+    # A time range an academic search has fully harvested for a
+    # hashtag. Ranges with the same options never overlap.
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    include_retweets = models.BooleanField(default=False)
+    get_replies = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['hashtag', 'start_time'], name = 'harvested_hashtag_start_time')
+        ]
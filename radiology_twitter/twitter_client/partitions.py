@@ -0,0 +1,192 @@
+"""
+Monthly RANGE partitioning of the tweet table on MySQL.
+
+MySQL requires every unique key of a partitioned table to include the
+partitioning column and doesn't allow foreign keys on it. Enabling
+partitioning therefore drops the foreign keys from and to the tweet
+table and widens its primary key and tweet_id key with created_at.
+Tweets are still deduplicated on tweet_id by the bulk writer.
+"""
+import datetime
+
+TABLE = "twitter_client_tweet"
+CATCH_ALL = "pmax"
+
+
+def monthStart(date):
+    return datetime.date(date.year, date.month, 1)
+
+
+def addMonths(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+
+def partitionName(month):
+    return f"p{month.year}{month.month:02d}"
+
+
+def partitionMonth(name):
+    return datetime.date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def planPartitions(first_month, last_month):
+    """
+    Returns [(name, less_than), ...] for one partition per
+    month from first_month up to and including last_month
+    """
+    partitions = []
+    month = monthStart(first_month)
+
+    while month <= last_month:
+        upper = addMonths(month, 1)
+        partitions.append((partitionName(month), upper.isoformat()))
+        month = upper
+
+    return partitions
+
+
+def partitionClauses(partitions):
+    return ", ".join(
+        f"PARTITION {name} VALUES LESS THAN ('{less_than}')" for name, less_than in partitions
+    )
+
+
+def existingPartitions(cursor):
+    """
+    Returns the names of the tweet table's partitions in
+    order, or an empty list if it isn't partitioned
+    """
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """,
+        [TABLE]
+    )
+
+    return [row[0] for row in cursor.fetchall()]
+
+
+def foreignKeys(cursor):
+    """
+    Returns (table, constraint) for every foreign key
+    from or to the tweet table
+    """
+    cursor.execute(
+        """
+        SELECT DISTINCT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+        AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+        """,
+        [TABLE, TABLE]
+    )
+
+    return cursor.fetchall()
+
+
+def tweetIdKey(cursor):
+    cursor.execute(
+        """
+        SELECT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        AND COLUMN_NAME = 'tweet_id' AND NON_UNIQUE = 0 AND SEQ_IN_INDEX = 1
+        """,
+        [TABLE]
+    )
+
+    row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def enablePartitioning(cursor, months_ahead=3):
+    cursor.execute(f"SELECT MIN(created_at) FROM {TABLE}")
+    oldest = cursor.fetchone()[0] or datetime.datetime.utcnow()
+
+    this_month = monthStart(datetime.date.today())
+    partitions = planPartitions(monthStart(oldest), addMonths(this_month, months_ahead))
+
+    for table, constraint in foreignKeys(cursor):
+        cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {constraint}")
+
+    key = tweetIdKey(cursor)
+
+    cursor.execute(
+        f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+        + (f", DROP INDEX {key}" if key else "")
+        + ", ADD UNIQUE KEY tweet_tweet_id_created_at (tweet_id, created_at)"
+    )
+
+    cursor.execute(
+        f"ALTER TABLE {TABLE} PARTITION BY RANGE COLUMNS(created_at) ("
+        f"{partitionClauses(partitions)}, PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE))"
+    )
+
+    return [name for name, _ in partitions]
+
+
+def rollPartitions(cursor, months_ahead=3):
+    """
+    Splits monthly partitions off the catch-all partition until
+    there is one for every month up to `months_ahead` from now
+    """
+    names = [n for n in existingPartitions(cursor) if n != CATCH_ALL]
+    last_month = addMonths(monthStart(datetime.date.today()), months_ahead)
+
+    if names:
+        first_month = addMonths(partitionMonth(names[-1]), 1)
+    else:
+        first_month = monthStart(datetime.date.today())
+
+    partitions = planPartitions(first_month, last_month)
+
+    if partitions:
+        cursor.execute(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION {CATCH_ALL} INTO ("
+            f"{partitionClauses(partitions)}, PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE))"
+        )
+
+    return [name for name, _ in partitions]
+
+
+def oldPartitions(cursor, before):
+    return [
+        n for n in existingPartitions(cursor)
+        if n != CATCH_ALL and partitionMonth(n) < monthStart(before)
+    ]
+
+
+def dropPartitions(cursor, before):
+    """
+    Drops every monthly partition older than `before` (a date). This is
+    a metadata change, unlike deleting the rows. Links and entities of
+    the dropped tweets are left behind and no longer join to a tweet.
+    """
+    names = oldPartitions(cursor, before)
+
+    if names:
+        cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(names)}")
+
+    return names
+
+
+def archivePartitions(cursor, before):
+    """
+    Moves every monthly partition older than `before` into a table of
+    its own (twitter_client_tweet_archive_pYYYYMM) and drops it from
+    the tweet table
+    """
+    names = oldPartitions(cursor, before)
+
+    for name in names:
+        archive = f"{TABLE}_archive_{name}"
+
+        cursor.execute(f"CREATE TABLE {archive} LIKE {TABLE}")
+        cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE {TABLE} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+        cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {name}")
+
+    return names
@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+
+# for working with date and time
+import datetime
+
+from django.db import connection, transaction
+
+
+class PageWriter:
+    """
+    Runs database writes on a thread of its own so fetching the
+    next page doesn't wait for the last one to be written.
+
+    Writes are callables queued with submit(). The queue is bounded,
+    so fetchers block when the writer falls behind. Queued writes are
+    committed in batches of up to `batch_size`, or whatever has queued
+    up after `batch_seconds`, in one transaction per batch.
+    """
+
+    def __init__(self, queue_size=20, batch_size=10, batch_seconds=5):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+
+        self.closed = False
+        self.lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, write):
+        # Nothing reads the queue after close, so a
+        # put could block once it fills up
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The page writer is closed")
+
+            self.queue.put(write)
+
+    def run(self):
+        closing = False
+
+        try:
+            while not closing:
+                batch = []
+                deadline = time.monotonic() + self.batch_seconds
+
+                while len(batch) < self.batch_size:
+                    try:
+                        write = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+
+                    if write is None:
+                        closing = True
+                        break
+
+                    batch.append(write)
+
+                if batch:
+                    self.commit(batch)
+
+        finally:
+            connection.close()
+
+    def commit(self, batch):
+        try:
+            with transaction.atomic():
+                for write in batch:
+                    write()
+
+        except Exception:
+            # Don't let one bad page take the rest of the batch with it
+            for write in batch:
+                try:
+                    with transaction.atomic():
+                        write()
+
+                except Exception as e:
+                    with open("error.txt", "a") as f:
+                        f.write(f'{datetime.datetime.now()}: Failed to write page: {e}\n')
+
+    def close(self):
+        """
+        Writes everything still queued and stops the writer thread
+        """
+        with self.lock:
+            if self.closed:
+                return
+
+            self.closed = True
+            self.queue.put(None)
+
+        self.thread.join()
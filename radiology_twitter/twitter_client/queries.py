@@ -0,0 +1,59 @@
+"""
+Entity lookups that use the indexed TweetEntity rows
+instead of LIKE scans over the comma joined Tweet columns.
+"""
+from django.db.models import Count
+
+from twitter_client.models import Tweet, TweetEntity
+
+
+def normalize(kind, value):
+    if kind == TweetEntity.HASHTAG:
+        return value.lstrip("#").lower()
+
+    if kind == TweetEntity.MENTION:
+        return value.lstrip("@").lower()
+
+    return value
+
+
+def tweetsWithEntity(kind, value):
+    return Tweet.objects.filter(
+        id__in=TweetEntity.objects.filter(
+            kind=kind, value=normalize(kind, value)
+        ).values("tweet_id")
+    )
+
+
+def tweetsWithHashtag(tag):
+    return tweetsWithEntity(TweetEntity.HASHTAG, tag)
+
+
+def tweetsMentioning(username):
+    return tweetsWithEntity(TweetEntity.MENTION, username)
+
+
+def tweetsWithMedia(url):
+    return tweetsWithEntity(TweetEntity.MEDIA, url)
+
+
+def cooccurringHashtags(tag, limit=20):
+    """
+    Returns [(hashtag, tweet count), ...] for the hashtags
+    used most often in the same tweets as `tag`
+    """
+    tag = normalize(TweetEntity.HASHTAG, tag)
+
+    tweets = TweetEntity.objects.filter(
+        kind=TweetEntity.HASHTAG, value=tag
+    ).values("tweet_id")
+
+    return list(
+        TweetEntity.objects.filter(
+            kind=TweetEntity.HASHTAG, tweet_id__in=tweets
+        ).exclude(
+            value=tag
+        ).values("value").annotate(
+            tweets=Count("tweet_id")
+        ).order_by("-tweets").values_list("value", "tweets")[:limit]
+    )
@@ -0,0 +1,173 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket. `rate` tokens are added every
+    second up to `capacity`; acquire() blocks until one is free.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# Request quotas per endpoint, as (requests per second, burst size).
+# Standard search allows 450 requests per 15 minutes. Full archive
+# search allows 300 requests per 15 minutes and 1 request per second.
+RATES = {
+    "standard": (450 / 900, 10),
+    "academic": (300 / 900, 1),
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def shareLimits(share):
+    """
+    Divides every endpoint's quota by `share`, for when the quota is
+    split between several processes
+    """
+    for endpoint, (rate, capacity) in list(RATES.items()):
+        RATES[endpoint] = (rate / share, max(1, capacity // share))
+
+    # A forked process inherits the parent's buckets at the full quota
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def getLimiter(endpoint):
+    """
+    Returns the bucket shared by every crawler using `endpoint`
+    """
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            rate, capacity = RATES.get(endpoint, RATES["standard"])
+            _limiters[endpoint] = TokenBucket(rate, capacity)
+
+        return _limiters[endpoint]
+
+
+class RateLimitBudget:
+    """
+    Tracks the rate limit window of one API url from the
+    x-rate-limit-* response headers.
+    """
+
+    # Start spreading requests out once this many are left
+    slowdown_threshold = 10
+
+    def __init__(self, url):
+        self.url = url
+        self.limit = None
+        self.remaining = None
+        self.reset = None  # epoch seconds
+        self.lock = threading.Lock()
+
+    def update(self, headers):
+        with self.lock:
+            if "x-rate-limit-limit" in headers:
+                self.limit = int(headers["x-rate-limit-limit"])
+
+            if "x-rate-limit-remaining" in headers:
+                self.remaining = int(headers["x-rate-limit-remaining"])
+
+            if "x-rate-limit-reset" in headers:
+                self.reset = int(headers["x-rate-limit-reset"])
+
+    def exhausted(self, fallback=60):
+        """
+        Marks the window as used up after a 429. If the response
+        didn't say when the window resets, wait `fallback` seconds.
+        """
+        with self.lock:
+            self.remaining = 0
+
+            if self.reset is None or self.reset <= time.time():
+                self.reset = int(time.time()) + fallback
+
+    def delay(self):
+        """
+        Seconds to wait before the next request is sent
+        """
+        with self.lock:
+            if self.remaining is None or self.reset is None:
+                return 0
+
+            until_reset = self.reset - time.time()
+
+            if until_reset <= 0:
+                return 0
+
+            if self.remaining <= 0:
+                # Add a second of slack for clock skew
+                return until_reset + 1
+
+            if self.remaining < self.slowdown_threshold:
+                # Spread what's left evenly over the window
+                return until_reset / self.remaining
+
+            return 0
+
+    def wait(self):
+        delay = self.delay()
+
+        if delay:
+            print(f"Rate limit budget low for {self.url}. Sleeping {int(delay)}s")
+            time.sleep(delay)
+
+    def state(self):
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset": self.reset
+            }
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def getBudget(url):
+    """
+    Returns the shared budget for an API url
+    """
+    with _budgets_lock:
+        if url not in _budgets:
+            _budgets[url] = RateLimitBudget(url)
+
+        return _budgets[url]
+
+
+def budgetState():
+    """
+    Returns {url: {"limit", "remaining", "reset"}} for every url seen so far
+    """
+    with _budgets_lock:
+        budgets = list(_budgets.values())
+
+    return {budget.url: budget.state() for budget in budgets}
@@ -0,0 +1,196 @@
+"""
+Record and replay of Twitter API responses.
+
+A cassette is a JSON file holding a list of interactions;
+
+    {"path": "/2/tweets/search/recent", "query": "#radiology",
+     "next_token": null, "status": 200, "headers": {...}, "body": {...}}
+
+ReplaySession serves them in place of TwitterSession, so get_tweets
+can run without the API (--replay). RecordingSession saves real
+responses to a cassette as they come in (--record).
+"""
+import json
+import threading
+import time
+
+from urllib.parse import urlparse
+
+from twitter_client.client import TwitterSession
+
+
+class ReplayResponse:
+    def __init__(self, status, headers, body):
+        self.status_code = status
+        self.headers = headers
+        self.content = json.dumps(body).encode() if body is not None else b""
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ReplaySession:
+    """
+    Serves the interactions in a cassette. Requests are matched on the
+    url path, query and next_token; an interaction whose query is null
+    matches any query. Interactions with the same key are served in
+    order (e.g a 429 and then the page), the last one repeating.
+    """
+
+    # Replayed responses aren't subject to the API's request quota
+    offline = True
+
+    def __init__(self, interactions):
+        self.interactions = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        for interaction in interactions:
+            key = (interaction["path"], interaction.get("query"), interaction.get("next_token"))
+            self.interactions.setdefault(key, []).append(interaction)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def get(self, url, params=None, headers=None):
+        params = params or {}
+        path = urlparse(url).path
+        next_token = params.get("next_token")
+
+        with self.lock:
+            self.requests += 1
+
+            matches = (
+                self.interactions.get((path, params.get("query"), next_token))
+                or self.interactions.get((path, None, next_token))
+            )
+
+            if not matches:
+                return ReplayResponse(404, {}, {"title": f"No recorded response for {path}"})
+
+            interaction = matches.pop(0) if len(matches) > 1 else matches[0]
+
+        return ReplayResponse(interaction["status"], interaction.get("headers", {}), interaction.get("body"))
+
+    def stats(self):
+        return {"replay": {"requests": self.requests, "connections": 0, "reused": self.requests}}
+
+    def close(self):
+        pass
+
+
+class RecordingSession(TwitterSession):
+    """
+    A TwitterSession that also writes every response to a cassette
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.interactions = []
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None):
+        response = super().get(url, params=params, headers=headers)
+        params = params or {}
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+
+        with self.lock:
+            self.interactions.append({
+                "path": urlparse(url).path,
+                "query": params.get("query"),
+                "next_token": params.get("next_token"),
+                "status": response.status_code,
+                "headers": {
+                    k: v for k, v in response.headers.items() if k.lower().startswith("x-rate-limit")
+                },
+                "body": body
+            })
+
+        return response
+
+    def close(self):
+        with open(self.path, "w") as f:
+            json.dump(self.interactions, f)
+
+        super().close()
+
+
+def syntheticCassette(pages=10, tweets_per_page=100, path="/2/tweets/search/recent",
+                      rate_limit_every=0, first_id=10 ** 18):
+    """
+    Builds a cassette of `pages` chained search pages of synthetic
+    tweets. With rate_limit_every=N every Nth page is answered with a
+    429 first. The tweets carry the hashtags #radiology and #xray.
+    Any counts request is answered with the same 24 hourly buckets.
+    """
+    interactions = []
+    # Search results come newest first
+    tweet_id = first_id + pages * tweets_per_page + 1
+
+    for number in range(pages):
+        next_token = f"page{number}" if number else None
+
+        if rate_limit_every and number and number % rate_limit_every == 0:
+            interactions.append({
+                "path": path, "query": None, "next_token": next_token, "status": 429,
+                "headers": {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(int(time.time()))},
+                "body": {"title": "Too Many Requests"}
+            })
+
+        tweets = []
+        users = []
+
+        for i in range(tweets_per_page):
+            tweet_id -= 1
+
+            tweets.append({
+                "id": str(tweet_id), "text": f"Synthetic tweet {tweet_id} #radiology #xray",
+                "created_at": "2021-10-01T12:00:00.000Z", "lang": "en",
+                "author_id": str(i), "conversation_id": str(tweet_id),
+                "public_metrics": {"retweet_count": 0, "reply_count": 0, "like_count": 1, "quote_count": 0},
+                "entities": {
+                    "hashtags": [{"tag": "radiology"}, {"tag": "xray"}],
+                    "mentions": [{"username": f"user{i}"}]
+                }
+            })
+
+            users.append({
+                "id": str(i), "username": f"user{i}", "name": f"User {i}", "description": "",
+                "public_metrics": {"followers_count": 1, "following_count": 1, "tweet_count": 1}
+            })
+
+        meta = {"result_count": tweets_per_page, "newest_id": tweets[0]["id"], "oldest_id": tweets[-1]["id"]}
+
+        if number + 1 < pages:
+            meta["next_token"] = f"page{number + 1}"
+
+        interactions.append({
+            "path": path, "query": None, "next_token": next_token, "status": 200,
+            "headers": {"x-rate-limit-remaining": "450", "x-rate-limit-reset": str(int(time.time()) + 900)},
+            "body": {"data": tweets, "includes": {"users": users}, "meta": meta}
+        })
+
+    counts = [
+        {
+            "start": f"2021-10-01T{hour:02d}:00:00.000Z",
+            "end": f"2021-10-01T{hour + 1:02d}:00:00.000Z" if hour < 23 else "2021-10-02T00:00:00.000Z",
+            "tweet_count": pages * tweets_per_page if hour == 12 else 0
+        }
+        for hour in range(24)
+    ]
+
+    interactions.append({
+        "path": path.replace("/search/", "/counts/"), "query": None, "next_token": None, "status": 200,
+        "headers": {"x-rate-limit-remaining": "300", "x-rate-limit-reset": str(int(time.time()) + 900)},
+        "body": {"data": counts, "meta": {"total_tweet_count": pages * tweets_per_page}}
+    })
+
+    return interactions
@@ -0,0 +1,103 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+
+from twitter_client.models import Conversation
+
+
+class ReplyHarvester:
+    """
+    Collects tweets to harvest replies for while the main crawl runs,
+    and searches them in OR-batched queries on a small thread pool of
+    its own. A tweet's replies are the tweets of the conversation it
+    started that reply to its author, i.e conversation_id:X to:author.
+
+    Each tweet is only searched once per run, and not at all if an
+    earlier run already harvested its conversation.
+    """
+
+    def __init__(self, command, endpoint, concurrency=2):
+        self.command = command
+        self.endpoint = endpoint
+        self.limit = command.query_limits.get(endpoint, command.query_limits["standard"])
+
+        self.pending = {}  # tweet_id: (author_id, [Hashtag, ...])
+        self.seen = set()
+        self.lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self.futures = []
+        self.stopped = False
+        # Set by getReplies when a batch couldn't be searched
+        self.failed = False
+
+    def buildQuery(self, tweets):
+        # tweets are (tweet_id, author_id) pairs
+        return " OR ".join(f"(conversation_id:{t} to:{a})" for t, a in tweets)
+
+    def add(self, tweet_id, author_id, hashtags):
+        with self.lock:
+            if self.stopped or tweet_id in self.seen:
+                return
+
+            self.seen.add(tweet_id)
+
+            # Send the batch off before it outgrows the query limit
+            tweets = [(t, a) for t, (a, _) in self.pending.items()] + [(tweet_id, author_id)]
+
+            if self.pending and len(self.buildQuery(tweets)) > self.limit:
+                self.submit()
+
+            self.pending[tweet_id] = (author_id, hashtags)
+
+    def submit(self):
+        # Called with self.lock held
+        batch = self.pending
+        self.pending = {}
+        self.futures.append(self.executor.submit(self.harvest, batch))
+
+    def harvest(self, tweets):
+        try:
+            harvested = set(
+                Conversation.objects.filter(
+                    conversation_id__in=tweets.keys()
+                ).values_list("conversation_id", flat=True)
+            )
+
+            tweets = {t: v for t, v in tweets.items() if t not in harvested}
+
+            if tweets:
+                # The hashtags of each conversation, for the replies
+                conversations = {t: hashtags for t, (_, hashtags) in tweets.items()}
+                query = self.buildQuery((t, a) for t, (a, _) in tweets.items())
+
+                self.command.getReplies(self.endpoint, query, conversations)
+
+        finally:
+            connection.close()
+
+    def finish(self):
+        """
+        Searches whatever is still queued and waits for every batch
+        """
+        with self.lock:
+            if self.pending:
+                self.submit()
+
+        for future in self.futures:
+            future.result()
+
+        self.executor.shutdown()
+
+    def cancel(self):
+        """
+        Drops the batches that haven't started and waits for the
+        running ones, e.g. when the crawl failed. Their writes go
+        through the page writer, so this comes before closing it.
+        """
+        with self.lock:
+            self.stopped = True
+            self.pending = {}
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
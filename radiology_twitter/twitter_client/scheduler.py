@@ -0,0 +1,95 @@
+"""
+Adaptive polling intervals for run_scheduler.
+
+Each hashtag is polled often enough that a poll fetches about
+`target_tweets` new tweets: busy hashtags are polled every few
+minutes, quiet ones up to once a day. The tweet rate comes from what
+the last polls found, or the stored counts (Volume) before that, and
+intervals are stretched while the search rate limit is being used up
+faster than its window resets.
+"""
+import datetime
+import random
+import time
+
+from django.db.models import Sum
+
+from twitter_client.models import Volume
+
+
+# Weight of the latest poll in the smoothed tweet rate
+SMOOTHING = 0.5
+
+# Length of the search endpoints' rate limit window
+WINDOW_SECONDS = 15 * 60
+
+MAX_STRETCH = 10
+
+
+def observedRate(previous, tweets, elapsed):
+    """
+    Returns the smoothed tweets per second after a poll that found
+    `tweets` new tweets `elapsed` seconds after the previous one
+    """
+    if not elapsed:
+        return previous
+
+    rate = tweets / elapsed
+
+    if previous is None:
+        return rate
+
+    return SMOOTHING * rate + (1 - SMOOTHING) * previous
+
+
+def volumeRate(hashtag, now, hours=24):
+    """
+    Returns tweets per second over the last `hours` from the
+    stored counts, or None if there aren't any
+    """
+    since = now - datetime.timedelta(hours=hours)
+
+    total = Volume.objects.filter(
+        hashtag=hashtag, start_time__gte=since
+    ).aggregate(Sum("tweet_count"))["tweet_count__sum"]
+
+    if total is None:
+        return None
+
+    return total / (hours * 3600)
+
+
+def budgetStretch(state, now=None):
+    """
+    Returns how much to stretch intervals by (1 or more), from a rate
+    limit budget's state. It's above 1 while the requests left are a
+    smaller share of the limit than the time left is of the window.
+    """
+    now = now or time.time()
+
+    if not state or not state.get("limit") or state.get("remaining") is None or not state.get("reset"):
+        return 1
+
+    time_left = (state["reset"] - now) / WINDOW_SECONDS
+
+    if time_left <= 0:
+        return 1
+
+    requests_left = max(state["remaining"] / state["limit"], 1 / MAX_STRETCH)
+
+    return min(MAX_STRETCH, max(1, time_left / requests_left))
+
+
+def nextInterval(rate, stretch, target_tweets, min_interval, max_interval):
+    """
+    Returns the seconds until the next poll of a hashtag that gets
+    `rate` tweets per second. Jittered so polls spread out over time.
+    """
+    if rate:
+        interval = target_tweets / rate
+    else:
+        interval = max_interval
+
+    interval = min(max_interval, max(min_interval, interval * stretch))
+
+    return int(interval * random.uniform(0.9, 1.1))
@@ -0,0 +1,220 @@
+"""
+An on-disk Bloom filter of the tweet ids already stored.
+
+The same tweet comes back under several hashtags and across
+overlapping runs. saveTweets asks the filter first and only looks up
+the ids it might have seen, so new tweets cost no lookup at all. A
+Bloom filter can say "maybe" for an id it hasn't seen (a lookup that
+finds nothing) but never "no" for one it has, as long as every writer
+adds the tweets it stores. Ids are added before the tweets are
+committed, so a failed write can only leave extra ids behind.
+
+The file is memory-mapped and shared by every process writing tweets
+(get_tweets, run_jobs, run_scheduler, load_tweets). A filter created
+while tweets are already stored isn't used until rebuild_seen_filter
+has filled it from the database.
+
+Tweets stored by a writer that doesn't share the file are missing
+from it. saveTweets still stores them correctly (the insert skips
+them and works out which tweets it really created), but their lookup
+is saved for nothing until rebuild_seen_filter adds them.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+
+from twitter_client.models import Tweet
+
+
+MAGIC = b"SEENBF01"
+
+# magic, bits, hashes, ready, ids added
+HEADER = struct.Struct("<8sQIIQ")
+
+
+def filterSize(capacity, error_rate):
+    """
+    Returns the (bits, hashes) of a Bloom filter holding
+    `capacity` ids with the given false positive rate
+    """
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+
+    return (bits, hashes)
+
+
+class SeenFilter:
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+
+        self.file = open(self.path, "r+b")
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        magic, self.bits, self.hashes, _, _ = HEADER.unpack_from(self.map)
+
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a seen-tweet filter")
+
+    @classmethod
+    def create(cls, path, capacity, error_rate, ready=False):
+        bits, hashes = filterSize(capacity, error_rate)
+
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, bits, hashes, int(ready), 0))
+            f.truncate(HEADER.size + math.ceil(bits / 8))
+
+        return cls(path)
+
+    @property
+    def ready(self):
+        return bool(HEADER.unpack_from(self.map)[3])
+
+    @property
+    def count(self):
+        return HEADER.unpack_from(self.map)[4]
+
+    def replaced(self):
+        # rebuild_seen_filter swaps in a new file
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def positions(self, tweet_id):
+        digest = hashlib.blake2b(str(tweet_id).encode(), digest_size=16).digest()
+        first, second = struct.unpack("<QQ", digest)
+
+        # Double hashing: k positions from two hashes
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def mightContain(self, tweet_id):
+        return all(
+            self.map[HEADER.size + position // 8] & (1 << (position % 8))
+            for position in self.positions(tweet_id)
+        )
+
+    def add(self, tweet_ids, ready=None):
+        tweet_ids = list(tweet_ids)
+
+        # Other processes set bits in the same bytes
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+            try:
+                for tweet_id in tweet_ids:
+                    for position in self.positions(tweet_id):
+                        self.map[HEADER.size + position // 8] |= 1 << (position % 8)
+
+                magic, bits, hashes, was_ready, count = HEADER.unpack_from(self.map)
+                ready = was_ready if ready is None else int(ready)
+
+                HEADER.pack_into(self.map, 0, magic, bits, hashes, ready, count + len(tweet_ids))
+
+            finally:
+                if fcntl:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+seen_filter = None
+seen_filter_lock = threading.Lock()
+
+
+def getSeenFilter():
+    """
+    Returns this process's SeenFilter, or None if SEEN_FILTER_PATH
+    isn't set or the filter hasn't been built from the stored tweets
+    """
+    global seen_filter
+
+    path = settings.SEEN_FILTER_PATH
+
+    if not path:
+        return None
+
+    with seen_filter_lock:
+        if seen_filter and (seen_filter.path != str(path) or seen_filter.replaced()):
+            seen_filter.close()
+            seen_filter = None
+
+        if seen_filter is None:
+            if os.path.exists(path):
+                seen_filter = SeenFilter(path)
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+                # An empty database has nothing to fill it with
+                seen_filter = SeenFilter.create(
+                    path, settings.SEEN_FILTER_CAPACITY, settings.SEEN_FILTER_ERROR_RATE,
+                    ready=not Tweet.objects.exists()
+                )
+
+                if not seen_filter.ready:
+                    print(f"Run rebuild_seen_filter to start using {path}")
+
+        return seen_filter if seen_filter.ready else None
+
+
+def rebuildFilter(path, capacity, error_rate, chunk_size=50000):
+    """
+    Builds a filter of every stored tweet id next to `path` and swaps
+    it in. Returns the number of ids added.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    new_filter = SeenFilter.create(f"{path}.part", capacity, error_rate)
+    added = 0
+    last = 0
+
+    def addAfter(target, last):
+        # Keyset pagination, like the exports
+        added = 0
+
+        while True:
+            chunk = list(
+                Tweet.objects.filter(pk__gt=last).order_by("pk").values_list("pk", "tweet_id")[:chunk_size]
+            )
+
+            target.add(tweet_id for _, tweet_id in chunk)
+            added += len(chunk)
+
+            if len(chunk) < chunk_size:
+                return (added, chunk[-1][0] if chunk else last)
+
+            last = chunk[-1][0]
+
+    count, last = addAfter(new_filter, last)
+    added += count
+
+    new_filter.add([], ready=True)
+    new_filter.flush()
+    new_filter.close()
+
+    os.replace(f"{path}.part", path)
+
+    # Writers still on the old file switch over with their next page.
+    # Catch the tweets they stored in the meantime.
+    catch_up = SeenFilter(path)
+    added += addAfter(catch_up, last)[0]
+    catch_up.flush()
+    catch_up.close()
+
+    return added
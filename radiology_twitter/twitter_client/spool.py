@@ -0,0 +1,116 @@
+"""
+Compressed NDJSON spool of raw API pages.
+
+get_tweets --spool writes every page it fetches, together with what is
+needed to load it (hashtags, conversations), so load_tweets can load or
+re-load pages later without spending API quota.
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+EXTENSIONS = {
+    "gzip": ".ndjson.gz",
+    "zstd": ".ndjson.zst"
+}
+
+
+def openSpool(path, mode="rt"):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise Exception("zstandard must be installed to read .zst spool files")
+
+        return zstandard.open(path, mode, encoding="utf-8")
+
+    return gzip.open(path, mode, encoding="utf-8")
+
+
+def spoolFiles(paths):
+    """
+    Returns the finished spool files in `paths`, which
+    may be files or directories, oldest first
+    """
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith(tuple(EXTENSIONS.values()))
+            )
+        else:
+            files.append(path)
+
+    return sorted(files)
+
+
+def readSpool(path):
+    with openSpool(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Spool:
+    """
+    Appends records to a compressed NDJSON file, starting a new one
+    every `max_pages` records. Files are written under a .part name
+    and renamed once complete, so loaders never see half a file.
+    """
+
+    def __init__(self, directory, compression="gzip", max_pages=1000):
+        if compression == "zstd" and zstandard is None:
+            raise Exception("zstandard must be installed to use zstd compression")
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.extension = EXTENSIONS[compression]
+        self.max_pages = max_pages
+
+        self.file = None
+        self.path = None
+        self.pages = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def rotate(self):
+        self.closeFile()
+
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self.sequence += 1
+        self.path = os.path.join(
+            self.directory,
+            f"pages-{stamp}-{os.getpid()}-{self.sequence:04d}{self.extension}"
+        )
+
+        self.file = openSpool(self.path + ".part", "wt")
+        self.pages = 0
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+
+        with self.lock:
+            if self.file is None or self.pages >= self.max_pages:
+                self.rotate()
+
+            self.file.write(line + "\n")
+            self.pages += 1
+
+    def closeFile(self):
+        if self.file is not None:
+            self.file.close()
+            os.replace(self.path + ".part", self.path)
+            self.file = None
+
+    def close(self):
+        with self.lock:
+            self.closeFile()
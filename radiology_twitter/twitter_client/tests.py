@@ -1,3 +1,964 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
 
-# Create your tests here.
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlparse
+
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from unittest import skipUnless
+from unittest.mock import patch
+
+from twitter_client import columnar
+from twitter_client import ratelimit
+from twitter_client.client import TwitterSession
+from twitter_client.backfill import initWorker, planWindows, runWindow, shardWindows
+from twitter_client.models import (
+    Author, Conversation, Endpoint, Hashtag, Tweet, TweetEntity, TweetHashtagMap, CrawlState, Volume, ExportJob, SearchJob,
+    HashtagSchedule, HarvestedRange
+)
+from twitter_client.partitions import planPartitions
+from twitter_client.pipeline import PageWriter
+from twitter_client.replay import ReplaySession, syntheticCassette
+from twitter_client.seen import getSeenFilter
+from twitter_client.scheduler import budgetStretch, nextInterval
+from twitter_client.queries import tweetsMentioning, tweetsWithHashtag, cooccurringHashtags
+from twitter_client.coverage import mergeIntervals, subtractIntervals
+from twitter_client.exports import chunkQueryset, countRows, exportKey, iterateRows, tweetsQueryset, volumesQueryset
+from twitter_client.jobs import JobCancelled
+from twitter_client.management.commands.get_tweets import Command as GetTweetsCommand
+from twitter_client.volumes import missingRanges
+
+
+class ReplayTestCase(TransactionTestCase):
+    # get_tweets writes from its own threads, which
+    # can't see the data of an open test transaction
+    fixtures = ["endpoints"]
+
+    def setUp(self):
+        standard = Endpoint.objects.get(name="standard")
+        self.radiology = Hashtag.objects.create(name="radiology", endpoint=standard)
+        self.xray = Hashtag.objects.create(name="xray", endpoint=standard)
+
+    def replay(self, interactions, *args):
+        path = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(path, "w") as f:
+            json.dump(interactions, f)
+
+        with open(os.devnull, "w") as devnull:
+            call_command("get_tweets", f"--replay={path}", *args, stdout=devnull)
+
+
+class GetTweetsTests(ReplayTestCase):
+    def test_stores_every_page(self):
+        self.replay(syntheticCassette(pages=3, tweets_per_page=10))
+
+        self.assertEqual(Tweet.objects.count(), 30)
+        # Every tweet carries both hashtags of the OR-query
+        self.assertEqual(TweetHashtagMap.objects.count(), 60)
+
+    def test_retries_page_after_rate_limit(self):
+        self.replay(syntheticCassette(pages=4, tweets_per_page=10, rate_limit_every=2))
+
+        self.assertEqual(Tweet.objects.count(), 40)
+
+    def test_rerun_skips_stored_tweets(self):
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+
+        self.assertEqual(Tweet.objects.count(), 20)
+        self.assertEqual(TweetHashtagMap.objects.count(), 40)
+
+    def test_writes_inline_without_queue(self):
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10), "--queue_size=0")
+
+        self.assertEqual(Tweet.objects.count(), 20)
+
+    def test_concurrent_crawls_store_every_batch(self):
+        threads = set()
+        crawl = GetTweetsCommand.crawlHashtags
+
+        # SQLite's shared in-memory test database locks whole
+        # tables, so the crawls take turns writing to it
+        database = threading.Lock()
+
+        def crawlHashtags(*args):
+            threads.add(threading.current_thread())
+
+            with database:
+                return crawl(*args)
+
+        # One hashtag per query, so there are two batches to crawl at once
+        with patch.dict(GetTweetsCommand.query_limits, {"standard": 20}), \
+                patch.object(GetTweetsCommand, "crawlHashtags", crawlHashtags):
+            self.replay(syntheticCassette(pages=3, tweets_per_page=10), "--concurrency=2")
+
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(Tweet.objects.count(), 30)
+        self.assertEqual(TweetHashtagMap.objects.count(), 60)
+        self.assertEqual(CrawlState.objects.filter(completed=True).count(), 2)
+
+    def test_checkpoint_is_completed(self):
+        self.replay(syntheticCassette(pages=3, tweets_per_page=10))
+
+        state = CrawlState.objects.get()
+        self.assertEqual(state.pages, 3)
+        self.assertEqual(state.tweets, 30)
+        self.assertTrue(state.completed)
+
+    def test_watermark_is_the_newest_tweet(self):
+        self.replay(syntheticCassette(pages=3, tweets_per_page=10))
+
+        newest = max(Tweet.objects.values_list("tweet_id", flat=True), key=int)
+        self.radiology.refresh_from_db()
+        self.assertEqual(self.radiology.last_tweet, newest)
+
+        state = CrawlState.objects.get()
+        self.assertEqual(state.newest_id, newest)
+        self.assertEqual(state.oldest_id, min(Tweet.objects.values_list("tweet_id", flat=True), key=int))
+
+    def test_rerun_counts_duplicates(self):
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+
+        state = CrawlState.objects.get()
+        self.assertEqual(state.tweets, 0)
+        self.assertEqual(state.duplicates, 20)
+
+    def test_checkpoint_stops_at_a_failed_page(self):
+        cassette = syntheticCassette(pages=3, tweets_per_page=5)
+        first = cassette[0]["body"]["meta"]["oldest_id"]
+
+        # Tweets without their authors can't be stored
+        cassette[1]["body"]["includes"]["users"] = []
+
+        self.replay(cassette, "--resume")
+
+        state = CrawlState.objects.get()
+        self.assertFalse(state.completed)
+        self.assertEqual((state.pages, state.oldest_id), (1, first))
+        self.assertIsNone(Hashtag.objects.get(id=self.radiology.id).last_tweet)
+
+        # The API's answer for until_id=first: the last two pages
+        self.replay(syntheticCassette(pages=2, tweets_per_page=5), "--resume")
+
+        state.refresh_from_db()
+        self.assertTrue(state.completed)
+        self.assertEqual(state.pages, 3)
+        self.assertEqual(Tweet.objects.count(), 15)
+
+    def test_resume_continues_before_the_oldest_tweet(self):
+        state = CrawlState.objects.create(
+            query="#radiology", endpoint=self.radiology.endpoint,
+            newest_id="200", oldest_id="150", next_token="page2", pages=2
+        )
+
+        crawler = GetTweetsCommand()
+        crawler.resume = True
+        payload = {"query": "#radiology", "since_id": "100"}
+
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            resumed = crawler.getCrawlState("standard", "#radiology", None, [self.radiology], payload)
+
+        self.assertEqual(resumed.id, state.id)
+        self.assertEqual(payload["until_id"], "150")
+        self.assertNotIn("next_token", payload)
+
+
+class SpoolTests(ReplayTestCase):
+    def test_spooled_run_is_loaded(self):
+        spool = tempfile.mkdtemp()
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10), f"--spool={spool}", "--spool_only")
+
+        self.assertEqual(Tweet.objects.count(), 0)
+
+        # Its volumes records are skipped, not the whole file
+        self.xray.delete()
+
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            call_command("load_tweets", spool)
+
+        self.assertEqual(Tweet.objects.count(), 20)
+        self.assertEqual(TweetHashtagMap.objects.count(), 20)
+        self.assertTrue(Volume.objects.filter(hashtag=self.radiology).exists())
+        self.assertTrue(all(name.endswith(".loaded") for name in os.listdir(spool)))
+
+
+class ReplyTests(ReplayTestCase):
+    def replyPage(self, query, tweet_id, conversation_id):
+        return {
+            "path": "/2/tweets/search/recent", "query": query, "next_token": None, "status": 200,
+            "headers": {"x-rate-limit-remaining": "450", "x-rate-limit-reset": "0"},
+            "body": {
+                "data": [{
+                    "id": tweet_id, "text": "A reply", "created_at": "2021-10-01T13:00:00.000Z",
+                    "lang": "en", "author_id": "0", "conversation_id": conversation_id,
+                    "public_metrics": {"retweet_count": 0, "reply_count": 0, "like_count": 0, "quote_count": 0}
+                }],
+                "includes": {"users": [{
+                    "id": "0", "username": "user0", "name": "User 0", "description": "",
+                    "public_metrics": {"followers_count": 1, "following_count": 1, "tweet_count": 1}
+                }]},
+                "meta": {"result_count": 1, "newest_id": tweet_id, "oldest_id": tweet_id}
+            }
+        }
+
+    def test_replies_are_batched_and_harvested_once(self):
+        cassette = syntheticCassette(pages=1, tweets_per_page=20)
+        tweets = [(t["id"], t["author_id"]) for t in cassette[0]["body"]["data"]]
+
+        for tweet in cassette[0]["body"]["data"]:
+            tweet["public_metrics"]["reply_count"] = 1
+
+        def replyQuery(batch):
+            # Replies to the tweet's author in the conversation it started
+            return " OR ".join(f"(conversation_id:{t} to:{a})" for t, a in batch)
+
+        # Harvested by an earlier run
+        harvested = [t for t, _ in tweets[:2]]
+        Conversation.objects.bulk_create([Conversation(conversation_id=c) for c in harvested])
+
+        # 20 tweets don't fit in one 512 character query
+        batches = [tweets[:11], tweets[11:]]
+        self.assertGreater(len(replyQuery(tweets[:12])), 512)
+
+        for number, batch in enumerate(batches):
+            # Only matches if the harvested conversations were left out
+            query = replyQuery([(t, a) for t, a in batch if t not in harvested])
+            cassette.append(self.replyPage(query, str(number + 1), batch[-1][0]))
+
+        self.replay(cassette, "--get_replies")
+
+        self.assertEqual(Tweet.objects.count(), 22)
+        self.assertEqual(Conversation.objects.count(), 20)
+        # Attributed to the hashtags of the tweet they reply to
+        self.assertEqual(TweetHashtagMap.objects.filter(tweet__tweet_id="1").count(), 2)
+
+
+class MatchHashtagTests(SimpleTestCase):
+    def match(self, text, tags=()):
+        record = SimpleNamespace(id="1", text=text, hashtags=list(tags))
+        hashtags = [Hashtag(name="radiology"), Hashtag(name="xray")]
+
+        return [h.name for h in GetTweetsCommand().matchHashtags(record, hashtags)]
+
+    def test_entities_are_matched_first(self):
+        self.assertEqual(self.match("#radiology #xray", ["Radiology"]), ["radiology"])
+
+    def test_text_is_matched_without_entities(self):
+        self.assertEqual(self.match("Case of the day #XRay!"), ["xray"])
+        # Not part of a longer tag
+        self.assertEqual(self.match("#xrays #radiology"), ["radiology"])
+
+    def test_unmatched_tweets_keep_every_hashtag(self):
+        self.assertEqual(self.match("RT @someone: Case of the day #radiol…"), ["radiology", "xray"])
+
+
+class PageWriterTests(SimpleTestCase):
+    def test_writes_are_refused_after_close(self):
+        writer = PageWriter(queue_size=1)
+        writer.close()
+
+        with self.assertRaises(RuntimeError):
+            writer.submit(lambda: None)
+
+
+class VolumeTests(ReplayTestCase):
+    def test_rerun_upserts_volumes(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=10))
+        self.replay(syntheticCassette(pages=1, tweets_per_page=10))
+
+        # 24 hourly buckets for each of the two hashtags
+        self.assertEqual(Volume.objects.count(), 48)
+        self.assertEqual(Volume.objects.filter(hashtag=self.radiology, tweet_count=10).count(), 1)
+
+    def test_only_missing_buckets_are_requested(self):
+        day = datetime.datetime(2021, 10, 1, tzinfo=datetime.timezone.utc)
+        hour = datetime.timedelta(hours=1)
+
+        for number in (0, 1, 3, 4):
+            Volume.objects.create(
+                hashtag=self.radiology, start_time=day + number * hour,
+                end_time=day + (number + 1) * hour, tweet_count=1
+            )
+
+        # Still open when it was fetched
+        Volume.objects.filter(start_time=day + 4 * hour).update(updated_at=day + 4 * hour)
+
+        self.assertEqual(
+            missingRanges(self.radiology, Volume.HOUR, day, day + 6 * hour),
+            [(day + 2 * hour, day + 3 * hour), (day + 4 * hour, day + 6 * hour)]
+        )
+
+
+class CoverageTests(ReplayTestCase):
+    def setUp(self):
+        super().setUp()
+
+        academic = Endpoint.objects.get(name="academic")
+        Hashtag.objects.update(endpoint=academic)
+
+    def test_intervals_are_merged_and_subtracted(self):
+        day = datetime.datetime(2021, 10, 1, tzinfo=datetime.timezone.utc)
+        days = lambda n: day + datetime.timedelta(days=n)
+
+        self.assertEqual(
+            mergeIntervals([(days(3), days(5)), (days(0), days(2)), (days(1), days(3))]),
+            [(days(0), days(5))]
+        )
+        self.assertEqual(
+            subtractIntervals(days(0), days(10), [(days(2), days(4)), (days(6), days(12))]),
+            [(days(0), days(2)), (days(4), days(6))]
+        )
+
+    def test_academic_runs_only_search_the_gaps(self):
+        path = "/2/tweets/search/all"
+
+        self.replay(
+            syntheticCassette(pages=2, tweets_per_page=10, path=path), "--endpoint=academic",
+            "--start_time=2021-10-01T00:00:00Z", "--end_time=2021-10-10T00:00:00Z", "--skip_volumes"
+        )
+
+        self.assertEqual(HarvestedRange.objects.count(), 2)
+
+        # Only the day that wasn't harvested yet is searched
+        self.replay(
+            syntheticCassette(pages=1, tweets_per_page=10, path=path, first_id=10 ** 17), "--endpoint=academic",
+            "--start_time=2021-10-05T00:00:00Z", "--end_time=2021-10-11T00:00:00Z", "--skip_volumes"
+        )
+
+        self.assertEqual(
+            list(CrawlState.objects.order_by("id").values_list("start_time", "end_time")),
+            [("2021-10-01T00:00:00Z", "2021-10-10T00:00:00Z"), ("2021-10-10T00:00:00Z", "2021-10-11T00:00:00Z")]
+        )
+        self.assertEqual(
+            list(HarvestedRange.objects.filter(hashtag=self.radiology).values_list("start_time", "end_time")),
+            [(datetime.datetime(2021, 10, 1, tzinfo=datetime.timezone.utc),
+              datetime.datetime(2021, 10, 11, tzinfo=datetime.timezone.utc))]
+        )
+
+    def test_failed_replies_dont_count_as_harvested(self):
+        path = "/2/tweets/search/all"
+        cassette = syntheticCassette(pages=1, tweets_per_page=3, path=path)
+
+        for tweet in cassette[0]["body"]["data"]:
+            tweet["public_metrics"]["reply_count"] = 1
+
+        query = " OR ".join(f"(conversation_id:{t['id']} to:{t['author_id']})" for t in cassette[0]["body"]["data"])
+        cassette.append({
+            "path": path, "query": query, "next_token": None, "status": 503,
+            "headers": {}, "body": {"title": "Service Unavailable"}
+        })
+
+        self.replay(
+            cassette, "--endpoint=academic", "--get_replies", "--skip_volumes",
+            "--start_time=2021-10-01T00:00:00Z", "--end_time=2021-10-10T00:00:00Z"
+        )
+
+        # The tweets are harvested, but not their replies
+        self.assertTrue(HarvestedRange.objects.filter(get_replies=False).exists())
+        self.assertFalse(HarvestedRange.objects.filter(get_replies=True).exists())
+
+
+class BackfillTests(ReplayTestCase):
+    def test_window_progress_is_this_runs(self):
+        academic = Endpoint.objects.get(name="academic")
+        Hashtag.objects.update(endpoint=academic)
+
+        window = ("2021-10-01T00:00:00Z", "2021-10-10T00:00:00Z")
+
+        # Left by an earlier, unfinished run over part of the window
+        CrawlState.objects.create(
+            query="#other", endpoint=academic, pages=5, tweets=500,
+            start_time="2021-10-02T00:00:00Z", end_time="2021-10-03T00:00:00Z"
+        )
+
+        path = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(path, "w") as f:
+            json.dump(syntheticCassette(pages=2, tweets_per_page=10, path="/2/tweets/search/all"), f)
+
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            progress = runWindow(window, {"replay": path})
+
+        self.assertEqual(progress, {"pages": 2, "tweets": 20, "completed": True})
+
+
+class WindowTests(SimpleTestCase):
+    def test_windows_hold_about_window_tweets(self):
+        day = datetime.datetime(2021, 10, 1, tzinfo=datetime.timezone.utc)
+        hour = datetime.timedelta(hours=1)
+
+        # Two hashtags' counts add up per bucket
+        volumes = [
+            Volume(start_time=day + n * hour, end_time=day + (n + 1) * hour, tweet_count=50)
+            for n in range(6) for hashtag in range(2)
+        ]
+
+        self.assertEqual(planWindows(volumes, "2021-10-01T00:00:00Z", "2021-10-01T06:00:00Z", 200), [
+            ("2021-10-01T00:00:00Z", "2021-10-01T02:00:00Z"),
+            ("2021-10-01T02:00:00Z", "2021-10-01T04:00:00Z"),
+            ("2021-10-01T04:00:00Z", "2021-10-01T06:00:00Z")
+        ])
+
+    def test_windows_without_counts(self):
+        self.assertEqual(
+            planWindows([], "2021-10-01T00:00:00Z", "2021-10-02T00:00:00Z", 200),
+            [("2021-10-01T00:00:00Z", "2021-10-02T00:00:00Z")]
+        )
+
+    def test_shards_split_the_windows(self):
+        windows = [str(n) for n in range(5)]
+
+        self.assertEqual(shardWindows(windows, "0/2"), ["0", "2", "4"])
+        self.assertEqual(shardWindows(windows, "1/2"), ["1", "3"])
+
+    @patch.dict(ratelimit.RATES)
+    @patch.dict(ratelimit._limiters, clear=True)
+    def test_workers_split_a_limiter_made_before_forking(self):
+        # backfill_tweets fetches the volumes before the pool forks
+        rate = ratelimit.getLimiter("academic").rate
+        initWorker(4)
+
+        self.assertAlmostEqual(ratelimit.getLimiter("academic").rate, rate / 4)
+
+
+class SeenFilterTests(ReplayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), "tweets.bloom")
+
+    def test_stored_tweets_are_added_as_they_are_written(self):
+        with override_settings(SEEN_FILTER_PATH=self.path):
+            self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+            self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+
+            seen = getSeenFilter()
+
+        self.assertEqual(Tweet.objects.count(), 20)
+        self.assertEqual(TweetHashtagMap.objects.count(), 40)
+        self.assertEqual(seen.count, 20)
+        self.assertTrue(all(seen.mightContain(t) for t in Tweet.objects.values_list("tweet_id", flat=True)))
+        self.assertFalse(seen.mightContain("1"))
+
+    def test_tweets_missing_from_the_filter_are_stored_once(self):
+        with override_settings(SEEN_FILTER_PATH=self.path):
+            getSeenFilter()
+
+        # Stored by a run that doesn't use the filter
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+        entities = TweetEntity.objects.count()
+
+        with override_settings(SEEN_FILTER_PATH=self.path):
+            self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+
+        self.assertEqual(Tweet.objects.count(), 20)
+        self.assertEqual(TweetEntity.objects.count(), entities)
+        self.assertEqual(CrawlState.objects.get().tweets, 0)
+
+    def test_filter_is_used_once_rebuilt(self):
+        self.replay(syntheticCassette(pages=2, tweets_per_page=10))
+
+        with override_settings(SEEN_FILTER_PATH=self.path):
+            # It would miss the tweets stored already
+            self.assertIsNone(getSeenFilter())
+
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                call_command("rebuild_seen_filter", capacity=1000)
+
+            seen = getSeenFilter()
+
+        self.assertTrue(all(seen.mightContain(t) for t in Tweet.objects.values_list("tweet_id", flat=True)))
+
+
+class SearchJobTests(ReplayTestCase):
+    def test_job_reports_progress(self):
+        job = SearchJob.objects.create(start_time="2021-01-01T00:00:00Z", end_time="2022-01-01T00:00:00Z")
+
+        self.replay(syntheticCassette(pages=3, tweets_per_page=10), f"--job={job.id}")
+
+        job.refresh_from_db()
+        self.assertEqual(job.pages, 3)
+        self.assertEqual(job.tweets, 30)
+        self.assertEqual(job.current_query, "-is:retweet (#radiology OR #xray)")
+
+    def test_job_reports_the_window_being_searched(self):
+        academic = Endpoint.objects.get(name="academic")
+        Hashtag.objects.update(endpoint=academic)
+
+        day = lambda n: datetime.datetime(2021, 10, n, tzinfo=datetime.timezone.utc)
+
+        for hashtag in (self.radiology, self.xray):
+            HarvestedRange.objects.create(hashtag=hashtag, start_time=day(1), end_time=day(5))
+
+        job = SearchJob.objects.create(start_time="2021-10-01T00:00:00Z", end_time="2021-10-10T00:00:00Z")
+
+        self.replay(
+            syntheticCassette(pages=1, tweets_per_page=10, path="/2/tweets/search/all"), f"--job={job.id}",
+            "--endpoint=academic", "--skip_volumes", f"--start_time={job.start_time}", f"--end_time={job.end_time}"
+        )
+
+        status = self.client.get("/search-jobs").json()["jobs"][0]
+        self.assertEqual(status["current_start"], "2021-10-05T00:00:00Z")
+        self.assertEqual(status["current_end"], "2021-10-10T00:00:00Z")
+
+    def test_cancelled_job_stops(self):
+        job = SearchJob.objects.create(
+            start_time="2021-01-01T00:00:00Z", end_time="2022-01-01T00:00:00Z", cancel_requested=True
+        )
+
+        with self.assertRaises(JobCancelled):
+            self.replay(syntheticCassette(pages=3, tweets_per_page=10), f"--job={job.id}")
+
+        self.assertEqual(Tweet.objects.count(), 0)
+
+    def test_searches_are_queued_and_cancelled_from_the_ui(self):
+        self.client.post("/full-archive-search/", {"startDate": "2021-01-01", "endDate": "2021-01-31"})
+
+        job = SearchJob.objects.get()
+        self.assertEqual(job.status, SearchJob.PENDING)
+        self.assertEqual(job.end_time, "2021-01-31T23:59:59Z")
+
+        status = self.client.post(f"/search-jobs/{job.id}/cancel").json()
+        self.assertTrue(status["cancel_requested"])
+
+
+class SchedulerTests(ReplayTestCase):
+    def test_polls_due_hashtags_and_schedules_the_next_poll(self):
+        path = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(path, "w") as f:
+            json.dump(syntheticCassette(pages=2, tweets_per_page=10), f)
+
+        with open(os.devnull, "w") as devnull:
+            call_command("run_scheduler", f"--replay={path}", "--once", stdout=devnull)
+
+        self.assertEqual(Tweet.objects.count(), 20)
+
+        schedule = HashtagSchedule.objects.get(hashtag=self.radiology)
+        self.assertGreater(schedule.next_poll_at, schedule.last_polled_at)
+        self.assertIsNotNone(schedule.volumes_polled_at)
+
+    def test_a_failed_hashtag_doesnt_stop_the_others(self):
+        path = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(path, "w") as f:
+            json.dump(syntheticCassette(pages=1, tweets_per_page=10), f)
+
+        with patch(
+            "twitter_client.management.commands.run_scheduler.volumeRate", side_effect=[Exception("Lost"), 0.01]
+        ), open(os.devnull, "w") as devnull:
+            call_command("run_scheduler", f"--replay={path}", "--once", stdout=devnull)
+
+        self.assertEqual(HashtagSchedule.objects.filter(last_polled_at__isnull=False).count(), 1)
+
+    def test_scheduler_keeps_running_after_a_failed_poll(self):
+        path = os.path.join(tempfile.mkdtemp(), "cassette.json")
+
+        with open(path, "w") as f:
+            json.dump(syntheticCassette(pages=1, tweets_per_page=10), f)
+
+        # The second poll stops the loop the way Ctrl-C would
+        with patch(
+            "twitter_client.management.commands.run_scheduler.Command.poll",
+            side_effect=[Exception("Lost connection"), KeyboardInterrupt]
+        ) as poll, patch("time.sleep"), open(os.devnull, "w") as devnull:
+            call_command("run_scheduler", f"--replay={path}", stdout=devnull)
+
+        self.assertEqual(poll.call_count, 2)
+
+
+class SchedulerIntervalTests(SimpleTestCase):
+    def test_busier_hashtags_are_polled_more_often(self):
+        busy = nextInterval(1.0, 1, target_tweets=500, min_interval=300, max_interval=86400)
+        quiet = nextInterval(0.001, 1, target_tweets=500, min_interval=300, max_interval=86400)
+
+        self.assertLess(busy, quiet)
+        self.assertLessEqual(quiet, 86400 * 1.1)
+        self.assertGreaterEqual(busy, 300 * 0.9)
+
+    def test_intervals_stretch_when_the_budget_runs_low(self):
+        now = 1000000
+
+        # 10% of the requests left for half of the window
+        low = {"limit": 450, "remaining": 45, "reset": now + 450}
+        plenty = {"limit": 450, "remaining": 400, "reset": now + 450}
+
+        self.assertEqual(budgetStretch(low, now), 5)
+        self.assertEqual(budgetStretch(plenty, now), 1)
+        self.assertEqual(budgetStretch(None, now), 1)
+
+
+class ReplaySessionTests(SimpleTestCase):
+    def test_serves_interactions_in_order(self):
+        session = ReplaySession(syntheticCassette(pages=3, tweets_per_page=1, rate_limit_every=2))
+        url = "https://api.twitter.com/2/tweets/search/recent"
+
+        self.assertEqual(session.get(url, {"next_token": "page2"}).status_code, 429)
+        self.assertEqual(session.get(url, {"next_token": "page2"}).status_code, 200)
+        self.assertEqual(session.get(url, {"next_token": "missing"}).status_code, 404)
+
+
+class CassetteHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the API
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        response = self.server.replay.get(url.path, params=dict(parse_qsl(url.query)))
+        body = response.content
+
+        self.send_response(response.status_code)
+
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TwitterSessionTests(SimpleTestCase):
+    # A local server answers with the interactions of a cassette
+    def serve(self, interactions):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), CassetteHandler)
+        server.replay = ReplaySession(interactions)
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        session = TwitterSession(pool_size=2, backoff_factor=0)
+        self.addCleanup(session.close)
+
+        return (server, session, f"http://127.0.0.1:{server.server_port}/2/tweets/search/recent")
+
+    def test_server_errors_are_retried(self):
+        cassette = syntheticCassette(pages=1, tweets_per_page=1)
+        cassette.insert(0, {
+            "path": "/2/tweets/search/recent", "query": None, "next_token": None, "status": 503,
+            "headers": {}, "body": {"title": "Service Unavailable"}
+        })
+
+        server, session, url = self.serve(cassette)
+        response = session.get(url, params={"query": "#radiology"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.replay.requests, 2)
+
+    def test_rate_limits_are_left_to_the_caller(self):
+        server, session, url = self.serve(syntheticCassette(pages=3, tweets_per_page=1, rate_limit_every=2))
+
+        self.assertEqual(session.get(url, params={"next_token": "page2"}).status_code, 429)
+        self.assertEqual(server.replay.requests, 1)
+
+    def test_connections_are_reused(self):
+        server, session, url = self.serve(syntheticCassette(pages=3, tweets_per_page=1))
+
+        for token in (None, "page1", "page2"):
+            session.get(url, params={"next_token": token})
+
+        self.assertEqual(session.stats(), {"127.0.0.1": {"requests": 3, "connections": 1, "reused": 2}})
+
+    def test_responses_are_compressed(self):
+        server, session, url = self.serve(syntheticCassette(pages=1, tweets_per_page=2))
+        response = session.get(url)
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(response.json()["data"]), 2)
+
+
+class ExportTests(ReplayTestCase):
+    def test_tweets_csv_includes_author_details(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2))
+
+        response = self.client.post("/export-data", {
+            "hashtag": self.radiology.id,
+            "fromdate": "2021-01-01",
+            "todate": "2022-01-01",
+            "download": "tweets"
+        })
+
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        headers = rows[0].split(",")
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(headers[headers.index("author_id") + 1], "author_username")
+        self.assertIn("user0", rows[1].split(",") + rows[2].split(","))
+
+    def test_compressed_export(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2))
+
+        response = self.client.post("/export-data", {
+            "hashtag": self.radiology.id,
+            "fromdate": "2021-01-01",
+            "todate": "2022-01-01",
+            "download": "tweets",
+            "compress": "on"
+        })
+
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+
+        self.assertIn('filename="tweets.csv.gz"', response["Content-Disposition"])
+        self.assertEqual(len(content.splitlines()), 3)
+
+    @skipUnless(columnar.pyarrow, "pyarrow isn't installed")
+    def test_columnar_exports_are_typed(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=3))
+
+        for file_format, read in (
+            ("parquet", lambda f: columnar.pyarrow.parquet.read_table(f)),
+            ("arrow", lambda f: columnar.pyarrow.ipc.open_file(f).read_all())
+        ):
+            response = self.client.post("/export-data", {
+                "hashtag": self.radiology.id,
+                "fromdate": "2021-01-01",
+                "todate": "2022-01-01",
+                "download": "tweets",
+                "format": file_format
+            })
+
+            table = read(io.BytesIO(b"".join(response.streaming_content)))
+            schema = table.schema
+
+            self.assertEqual(table.num_rows, 3)
+            self.assertEqual(str(schema.field("created_at").type), "timestamp[us, tz=UTC]")
+            self.assertEqual(str(schema.field("like_count").type), "int64")
+            self.assertTrue(columnar.pyarrow.types.is_dictionary(schema.field("language").type))
+            self.assertEqual(table.column("author_username").to_pylist()[0], "user0")
+
+    @skipUnless(columnar.pyarrow, "pyarrow isn't installed")
+    def test_arrow_batches_share_dictionaries(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=6))
+
+        # Each batch brings a language the earlier ones didn't have
+        pks = list(Tweet.objects.order_by("pk").values_list("pk", flat=True))
+        Tweet.objects.filter(pk__in=pks[:2]).update(language="fr")
+        Tweet.objects.filter(pk__in=pks[2:4]).update(language="de")
+
+        with patch.object(columnar, "BATCH_ROWS", 2):
+            response = self.client.post("/export-data", {
+                "hashtag": self.radiology.id,
+                "fromdate": "2021-01-01",
+                "todate": "2022-01-01",
+                "download": "tweets",
+                "format": "arrow"
+            })
+
+            table = columnar.pyarrow.ipc.open_file(io.BytesIO(b"".join(response.streaming_content))).read_all()
+
+        self.assertEqual(sorted(table.column("language").to_pylist()), ["de", "de", "en", "en", "fr", "fr"])
+
+    def test_rows_are_read_in_chunks(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=5))
+
+        headers, queryset = tweetsQueryset(self.radiology, "2021-01-01", "2022-01-01")
+        rows = list(iterateRows(queryset, chunk_size=2))
+
+        self.assertEqual(len({row["tweet_id"] for row in rows}), 5)
+
+
+class ExportJobTests(ReplayTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Built within the request
+        cache = override_settings(EXPORT_WORKERS=0, EXPORT_CACHE_DIR=tempfile.mkdtemp())
+        cache.enable()
+        self.addCleanup(cache.disable)
+
+    def submit(self, download="tweets"):
+        return self.client.post("/export-jobs", {
+            "hashtag": self.radiology.id,
+            "fromdate": "2021-01-01",
+            "todate": "2022-01-01",
+            "download": download
+        }).json()
+
+    def test_lost_jobs_are_submitted_again(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=3))
+        first = self.submit()
+
+        # As if its worker was restarted halfway through
+        ExportJob.objects.filter(id=first["id"]).update(
+            status=ExportJob.RUNNING,
+            heartbeat_at=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+
+        second = self.submit()
+
+        self.assertNotEqual(second["id"], first["id"])
+        self.assertEqual(second["status"], ExportJob.DONE)
+        self.assertEqual(ExportJob.objects.get(id=first["id"]).status, ExportJob.FAILED)
+
+    def test_slow_exports_keep_reporting(self):
+        old = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        job = ExportJob.objects.create(
+            key="key", hashtag=self.radiology, download="tweets", file_format="csv",
+            filename="tweets.csv", status=ExportJob.RUNNING, heartbeat_at=old
+        )
+
+        # As if every row took longer than `every`
+        rows = countRows(job.id, iter(range(3)), every=0)
+        next(rows)
+        next(rows)
+
+        job.refresh_from_db()
+        self.assertEqual(job.rows, 1)
+        self.assertGreater(job.heartbeat_at, old)
+
+    def test_linking_a_stored_tweet_changes_the_key(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=3))
+        oldest = Tweet.objects.order_by("pk").first()
+
+        TweetHashtagMap.objects.filter(tweet=oldest, hashtag=self.radiology).delete()
+        before = exportKey(self.radiology, "tweets", "csv", False, "2021-01-01", "2022-01-01")
+
+        TweetHashtagMap.objects.create(tweet=oldest, hashtag=self.radiology)
+        after = exportKey(self.radiology, "tweets", "csv", False, "2021-01-01", "2022-01-01")
+
+        self.assertNotEqual(before, after)
+
+    def test_identical_exports_are_cached_until_data_changes(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2))
+
+        job = self.submit()
+        self.assertEqual(job["status"], ExportJob.DONE)
+        self.assertEqual(job["rows"], 2)
+        self.assertEqual(self.submit()["id"], job["id"])
+
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2, first_id=2 * 10 ** 18))
+
+        self.assertNotEqual(self.submit()["id"], job["id"])
+
+    def test_download_supports_etag_and_range(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2))
+
+        url = self.submit()["download"]
+        response = self.client.get(url)
+        content = b"".join(response.streaming_content)
+
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304
+        )
+
+        response = self.client.get(url, HTTP_RANGE="bytes=5-14")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), content[5:15])
+        self.assertEqual(response["Content-Range"], f"bytes 5-14/{len(content)}")
+
+    def test_least_recently_used_exports_are_evicted(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=2))
+
+        tweets = self.submit()
+
+        # Room for one of them
+        with override_settings(EXPORT_CACHE_MAX_BYTES=tweets["size"]):
+            self.submit("entities")
+
+        self.assertEqual(ExportJob.objects.get(id=tweets["id"]).status, ExportJob.EXPIRED)
+
+
+class EntityTests(ReplayTestCase):
+    def test_entities_are_indexed(self):
+        self.replay(syntheticCassette(pages=1, tweets_per_page=3))
+
+        self.assertEqual(tweetsWithHashtag("#Radiology").count(), 3)
+        self.assertEqual(tweetsMentioning("@user1").count(), 1)
+        self.assertEqual(cooccurringHashtags("radiology"), [("xray", 3)])
+
+    def test_tweets_stored_after_the_lookup_are_not_counted_again(self):
+        class NeverSeen:
+            # As if another writer stored every tweet after our lookup
+            def mightContain(self, tweet_id):
+                return False
+
+            def add(self, tweet_ids):
+                pass
+
+        self.replay(syntheticCassette(pages=2, tweets_per_page=5))
+        entities = TweetEntity.objects.count()
+
+        with patch("twitter_client.writer.getSeenFilter", NeverSeen):
+            self.replay(syntheticCassette(pages=2, tweets_per_page=5))
+
+        self.assertEqual(TweetEntity.objects.count(), entities)
+        self.assertEqual(CrawlState.objects.get().tweets, 0)
+        self.assertEqual(CrawlState.objects.get().duplicates, 10)
+
+
+class QueryPlanTests(TestCase):
+    # The index names show up in both SQLite's and MySQL's EXPLAIN output
+    fixtures = ["endpoints"]
+
+    def setUp(self):
+        self.hashtag = Hashtag.objects.create(
+            name="radiology", endpoint=Endpoint.objects.get(name="standard")
+        )
+
+    def test_tweets_export_uses_hashtag_index(self):
+        headers, queryset = tweetsQueryset(self.hashtag, "2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z")
+
+        # The query each chunk of the export runs
+        plan = chunkQueryset(queryset, last=1).explain()
+
+        self.assertIn("tweethashtagmap_hashtag_tweet", plan)
+        # SQLite's "USE TEMP B-TREE", MySQL's "Using filesort"
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotIn("filesort", plan)
+
+    def test_volumes_export_uses_hashtag_start_time_index(self):
+        headers, queryset = volumesQueryset(self.hashtag)
+
+        self.assertIn("volume_hashtag_start_time", queryset.explain())
+
+    def test_date_range_uses_created_at_index(self):
+        queryset = Tweet.objects.filter(
+            created_at__range=("2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z")
+        )
+
+        self.assertIn("tweet_created_at", queryset.explain())
+
+    def test_duplicate_links_are_rejected(self):
+        author = Author.objects.create(
+            author_id="1", username="user", bio="", name="",
+            followers_count=0, following_count=0, tweet_count=0
+        )
+        tweet = Tweet.objects.create(
+            tweet_id="1", text="", created_at="2021-01-01T00:00:00Z", language="en",
+            mentions="", hashtags="", media="", retweet_count=0, reply_count=0,
+            like_count=0, quote_count=0, author=author
+        )
+
+        TweetHashtagMap.objects.create(tweet=tweet, hashtag=self.hashtag)
+
+        with self.assertRaises(IntegrityError):
+            TweetHashtagMap.objects.create(tweet=tweet, hashtag=self.hashtag)
+
+
+class PartitionTests(SimpleTestCase):
+    def test_one_partition_per_month(self):
+        partitions = planPartitions(datetime.date(2021, 11, 15), datetime.date(2022, 1, 1))
+
+        self.assertEqual(partitions, [
+            ("p202111", "2021-12-01"),
+            ("p202112", "2022-01-01"),
+            ("p202201", "2022-02-01")
+        ])
@@ -1,10 +1,14 @@
-from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from . models import Hashtag, Endpoint, Tweet, Volume
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_POST
+from . models import Hashtag, Endpoint, ExportJob, SearchJob
+from . import columnar
+from . exports import exportQueryset, exportFormat, exportChunks, submitExport
 
-from django.core.management import call_command
-
-import csv
+import os
+import re
 
 
 def hashtagsEditor(request):
@@ -50,7 +54,8 @@ def hashtagsEditor(request):
 
     context = {
         "standard_hashtags": standard_hashtags,
-        "academic_hashtags": academic_hashtags
+        "academic_hashtags": academic_hashtags,
+        "search_jobs": SearchJob.objects.order_by("-id")[:20]
     }
 
     return render(request, 'index.html', context)
@@ -66,59 +71,194 @@ def fullArchive(request):
     get_replies = True if request.POST.get("getReplies", "").lower() == "on" else False
     include_retweets = True if request.POST.get("includeRetweets", "").lower() == "on" else False
 
-    command_arguments = {
-        "endpoint": "academic",
-        "start_time": dateToTimestamp(start, "00:00:00"),
-        "end_time": dateToTimestamp(end, "23:59:59")
+    # The run_jobs worker runs the search
+    SearchJob.objects.create(
+        start_time=dateToTimestamp(start, "00:00:00"),
+        end_time=dateToTimestamp(end, "23:59:59"),
+        get_replies=get_replies,
+        include_retweets=include_retweets
+    )
+
+    return redirect('/')
+
+
+def searchJobStatus(job):
+    return {
+        "id": job.id,
+        "start_time": job.start_time,
+        "end_time": job.end_time,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "pages": job.pages,
+        "tweets": job.tweets,
+        "current_query": job.current_query,
+        "current_start": job.current_start,
+        "current_end": job.current_end,
+        "error": job.error
     }
 
-    if get_replies:
-        command_arguments["get_replies"] = True
 
-    if include_retweets:
-        command_arguments["include_retweets"] = True
+def searchJobs(request):
+    jobs = SearchJob.objects.order_by("-id")[:20]
+
+    return JsonResponse({"jobs": [searchJobStatus(job) for job in jobs]})
+
+
+@require_POST
+def cancelSearchJob(request, job_id):
+    job = get_object_or_404(SearchJob, id=job_id)
+
+    SearchJob.objects.filter(
+        id=job.id, status__in=[SearchJob.PENDING, SearchJob.RUNNING]
+    ).update(cancel_requested=True)
 
-    # Call command
-    call_command('get_tweets', **command_arguments)
+    job.refresh_from_db()
 
-    return HttpResponse("Search ended successfully")
+    return JsonResponse(searchJobStatus(job))
 
 
-def renderCSV(headers, queryset, filename):
-    response = HttpResponse(
-        content_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+def renderCSV(headers, queryset, filename, compress=False):
+    # Rows are written out as they're read, so memory use
+    # doesn't grow with the size of the export
+    content_type, extension = exportFormat("csv", compress)
+
+    response = StreamingHttpResponse(
+        exportChunks(headers, queryset, "csv", compress),
+        content_type=content_type
     )
 
-    writer = csv.writer(response)
+    response['Content-Disposition'] = f'attachment; filename="{filename}{extension}"'
+
+    return response
+
+
+def renderColumnar(headers, queryset, filename, file_format):
+    if columnar.pyarrow is None:
+        return HttpResponse("pyarrow must be installed for Parquet and Arrow exports", status=501)
 
-    # Write first row (Headers)
-    writer.writerow(headers)
+    content_type, extension = exportFormat(file_format, False)
 
-    for row in queryset:
-        writer.writerow([row[field] for field in headers])
+    response = StreamingHttpResponse(
+        exportChunks(headers, queryset, file_format, False),
+        content_type=content_type
+    )
+
+    response['Content-Disposition'] = f'attachment; filename="{filename}{extension}"'
 
     return response
 
+
 def exportData(request):
     fromdate = request.POST.get("fromdate")
     todate = request.POST.get("todate")
     hashtag = Hashtag.objects.get(id=request.POST.get("hashtag"))
     download = request.POST.get("download")
+    compress = request.POST.get("compress", "").lower() == "on"
+    # csv, parquet or arrow
+    file_format = request.POST.get("format", "csv")
+
+    headers, queryset, filename = exportQueryset(hashtag, download, fromdate, todate)
+
+    if file_format in columnar.FORMATS:
+        return renderColumnar(headers, queryset, filename, file_format)
+
+    return renderCSV(headers, queryset, filename, compress)
+
 
-    if download == "volumes":
-        volume_fields = ["hashtag__name", "start_time", "end_time", "tweet_count"]
-        return renderCSV(
-            ["hashtag__name", "start_time", "end_time", "tweet_count"],
-            Volume.objects.filter(hashtag=hashtag).values(*volume_fields),
-            f"volumes_{hashtag.name}.csv"
+def exportJobStatus(job):
+    status = {
+        "id": job.id,
+        "status": job.status,
+        "rows": job.rows,
+        "size": job.size,
+        "error": job.error
+    }
+
+    if job.status == ExportJob.DONE:
+        status["download"] = reverse("export-job-download", args=[job.id])
+
+    return status
+
+
+@require_POST
+def exportJobs(request):
+    # Same parameters as exportData
+    job = submitExport(
+        Hashtag.objects.get(id=request.POST.get("hashtag")),
+        request.POST.get("download", "tweets"),
+        request.POST.get("format", "csv"),
+        request.POST.get("compress", "").lower() == "on",
+        request.POST.get("fromdate"),
+        request.POST.get("todate")
+    )
+
+    return JsonResponse(exportJobStatus(job))
+
+
+def exportJob(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id)
+
+    return JsonResponse(exportJobStatus(job))
+
+
+def exportJobETag(request, job_id):
+    # The key changes with the hashtag's data
+    job = ExportJob.objects.filter(id=job_id, status=ExportJob.DONE).first()
+
+    return job.key if job else None
+
+
+def fileRange(path, start, length, chunk_size=64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+
+            if not chunk:
+                break
+
+            length -= len(chunk)
+            yield chunk
+
+
+@condition(etag_func=exportJobETag)
+def exportJobDownload(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, status=ExportJob.DONE)
+
+    if not os.path.exists(job.path):
+        raise Http404("The export has been removed from the cache")
+
+    ExportJob.objects.filter(id=job.id).update(accessed_at=timezone.now())
+
+    content_type = exportFormat(job.file_format, job.compress)[0]
+    size = job.size
+    # Only single byte ranges (bytes=start-end) are supported
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("Range", ""))
+
+    if match and any(match.groups()):
+        start, end = match.groups()
+
+        if start:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        else:
+            # The last N bytes
+            start, end = max(0, size - int(end)), size - 1
+
+        if start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+        response = StreamingHttpResponse(
+            fileRange(job.path, start, end - start + 1), status=206, content_type=content_type
         )
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
     else:
-        # Render tweets CSV
-        fields = [f.name for f in Tweet._meta.fields]
-        queryset = Tweet.objects.filter(
-            tweethashtagmap__hashtag=hashtag,
-            created_at__range=(fromdate, todate)
-        ).values(*fields)
-
-        return renderCSV(fields, queryset, "tweets.csv")
+        response = FileResponse(open(job.path, "rb"), content_type=content_type)
+
+    response['Accept-Ranges'] = "bytes"
+    response['Content-Disposition'] = f'attachment; filename="{job.filename}"'
+
+    return response
@@ -0,0 +1,158 @@
+"""
+Incremental collection of tweet counts (Volume rows).
+
+Counts are kept per (hashtag, granularity, bucket start). Before
+querying a counts endpoint, missingRanges works out which buckets of
+the requested timespan aren't stored yet (or were still open when they
+were fetched), so reruns only ask for the gaps. saveVolumes upserts
+the returned buckets on that key.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from twitter_client.models import Volume
+
+
+GRANULARITIES = {
+    Volume.MINUTE: datetime.timedelta(minutes=1),
+    Volume.HOUR: datetime.timedelta(hours=1),
+    Volume.DAY: datetime.timedelta(days=1)
+}
+
+# How far back each endpoint's counts go when no start_time is
+# given. /counts/recent can't go further back than 7 days.
+LOOKBACK = {
+    "standard": datetime.timedelta(days=7),
+    "academic": datetime.timedelta(days=30)
+}
+
+# The API rejects an end_time less than 10 seconds ago
+END_MARGIN = datetime.timedelta(seconds=30)
+
+
+def asDatetime(value):
+    if isinstance(value, str):
+        return parse_datetime(value)
+
+    return value
+
+
+def floorTime(time, step):
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+    return time - (time - epoch) % step
+
+
+def ceilTime(time, step):
+    floor = floorTime(time, step)
+
+    return floor if floor == time else floor + step
+
+
+def countsWindow(endpoint, timespan, granularity, now=None):
+    """
+    Returns the (start, end) datetimes counts are collected for,
+    widened to whole buckets and clipped to what the endpoint serves
+    """
+    now = now or timezone.now()
+    step = GRANULARITIES[granularity]
+    earliest = now - LOOKBACK[endpoint]
+
+    if timespan:
+        start = asDatetime(timespan.get('start_time'))
+        end = asDatetime(timespan.get('end_time'))
+    else:
+        start, end = earliest, now
+
+    start = floorTime(start, step)
+
+    # Only whole buckets, so the oldest one isn't cut short
+    if endpoint == "standard" and start < earliest:
+        start = ceilTime(earliest + datetime.timedelta(minutes=1), step)
+
+    end = min(ceilTime(end, step), now - END_MARGIN)
+
+    return (start, end)
+
+
+def missingRanges(hashtag, granularity, start, end):
+    """
+    Returns the [(start, end), ...] runs of buckets between start and
+    end that aren't stored yet or hadn't ended when they were fetched
+    """
+    step = GRANULARITIES[granularity]
+
+    complete = set(
+        start_time for start_time, updated_at in Volume.objects.filter(
+            hashtag=hashtag,
+            granularity=granularity,
+            start_time__gte=start,
+            start_time__lt=end
+        ).values_list("start_time", "updated_at")
+        if start_time + step <= updated_at
+    )
+
+    ranges = []
+    bucket = start
+
+    while bucket < end:
+        if bucket not in complete:
+            bucket_end = min(bucket + step, end)
+
+            # Extend the previous run if it ends here
+            if ranges and ranges[-1][1] == bucket:
+                ranges[-1] = (ranges[-1][0], bucket_end)
+            else:
+                ranges.append((bucket, bucket_end))
+
+        bucket += step
+
+    return ranges
+
+
+def saveVolumes(volumes):
+    """
+    Upserts unsaved Volume instances on (hashtag, granularity,
+    start_time). Returns the number of buckets created.
+    """
+    now = timezone.now()
+    volumes = {
+        (v.hashtag_id, v.granularity, asDatetime(v.start_time)): v for v in volumes
+    }
+
+    if not volumes:
+        return 0
+
+    with transaction.atomic():
+        existing = {
+            (v.hashtag_id, v.granularity, v.start_time): v
+            for v in Volume.objects.filter(
+                hashtag_id__in={key[0] for key in volumes},
+                granularity__in={key[1] for key in volumes},
+                start_time__in={key[2] for key in volumes}
+            )
+        }
+
+        new_volumes = []
+        changed = []
+
+        for key, volume in volumes.items():
+            volume.start_time = key[2]
+            volume.end_time = asDatetime(volume.end_time)
+            volume.updated_at = now
+
+            if key in existing:
+                volume.pk = existing[key].pk
+                changed.append(volume)
+            else:
+                new_volumes.append(volume)
+
+        # ignore_conflicts covers a concurrent run storing
+        # the same bucket between our lookup and the insert
+        Volume.objects.bulk_create(new_volumes, batch_size=500, ignore_conflicts=True)
+        Volume.objects.bulk_update(changed, ["end_time", "tweet_count", "updated_at"], batch_size=500)
+
+    return len(new_volumes)
@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.db.models import Max
+
+from twitter_client.models import Author, AuthorSnapshot, Tweet, TweetEntity, TweetHashtagMap
+from twitter_client.seen import getSeenFilter
+
+
+AUTHOR_FIELDS = ["username", "bio", "name", "followers_count", "following_count", "tweet_count"]
+
+
+def saveAuthors(authors, snapshots=False):
+    """
+    Upserts unsaved Author instances. Only authors whose details
+    changed are updated. With `snapshots`, their current metrics
+    are also recorded as AuthorSnapshots.
+    """
+    authors = {a.author_id: a for a in authors}
+
+    if not authors:
+        return
+
+    with transaction.atomic():
+        existing = Author.objects.in_bulk(list(authors))
+
+        Author.objects.bulk_create(
+            [a for author_id, a in authors.items() if author_id not in existing],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+
+        changed = [
+            a for author_id, a in authors.items()
+            if author_id in existing and any(
+                getattr(a, f) != getattr(existing[author_id], f) for f in AUTHOR_FIELDS
+            )
+        ]
+
+        Author.objects.bulk_update(changed, AUTHOR_FIELDS, batch_size=500)
+
+        if snapshots:
+            AuthorSnapshot.objects.bulk_create(
+                [
+                    AuthorSnapshot(
+                        author_id=a.author_id,
+                        followers_count=a.followers_count,
+                        following_count=a.following_count,
+                        tweet_count=a.tweet_count
+                    )
+                    for a in authors.values()
+                ],
+                batch_size=500
+            )
+
+
+def buildEntities(tweet, tweet_pk):
+    """
+    Returns TweetEntity instances for the comma joined
+    hashtags, mentions and media of a Tweet
+    """
+    entities = set()
+
+    for kind, field, prefix in (
+        (TweetEntity.HASHTAG, "hashtags", "#"),
+        (TweetEntity.MENTION, "mentions", "@"),
+        (TweetEntity.MEDIA, "media", None)
+    ):
+        for value in (getattr(tweet, field) or "").split(","):
+            if prefix:
+                value = value.lstrip(prefix).lower()
+
+            if value:
+                entities.add((kind, value[:500]))
+
+    return [TweetEntity(tweet_id=tweet_pk, kind=kind, value=value) for kind, value in entities]
+
+
+def saveTweets(rows, authors=(), snapshots=False):
+    """
+    Bulk writes tweets, their entities and their hashtag links.
+
+    `rows` is an iterable of (unsaved Tweet instance, [Hashtag, ...])
+    pairs and may span several pages. Tweets that are already stored
+    are skipped, but their missing hashtag links are still created.
+    `authors` are the tweets' unsaved Author instances, upserted first.
+
+    Returns a dict with the inserted and skipped tweet counts.
+    """
+    saveAuthors(authors, snapshots)
+
+    tweets = {}
+    links = {}
+
+    # The same tweet can show up more than once (e.g replies
+    # fetched for a page), so collapse rows on tweet_id first
+    for tweet, hashtags in rows:
+        tweets.setdefault(tweet.tweet_id, tweet)
+
+        for hashtag in hashtags:
+            links.setdefault(tweet.tweet_id, {})[hashtag.id] = hashtag
+
+    if not tweets:
+        return {"inserted": 0, "skipped": 0}
+
+    # Bounding the lookups by created_at lets a partitioned
+    # tweet table only search the partitions of these tweets
+    created_at = sorted(t.created_at for t in tweets.values())
+    stored = Tweet.objects.filter(
+        tweet_id__in=tweets.keys(),
+        created_at__range=(created_at[0], created_at[-1])
+    )
+
+    seen = getSeenFilter()
+
+    # Tweets the filter has never seen aren't stored,
+    # so only the possible hits are looked up
+    if seen:
+        candidates = [tweet_id for tweet_id in tweets if seen.mightContain(tweet_id)]
+    else:
+        candidates = list(tweets)
+
+    with transaction.atomic():
+        if candidates:
+            existing = set(stored.filter(tweet_id__in=candidates).values_list("tweet_id", flat=True))
+        else:
+            existing = set()
+
+        new_tweets = [t for tweet_id, t in tweets.items() if tweet_id not in existing]
+
+        # Added before the commit, so a failed write can
+        # only leave extra ids in the filter, never miss one
+        if seen:
+            seen.add(t.tweet_id for t in new_tweets)
+
+        # Rows this insert creates get ids above the mark
+        mark = Tweet.objects.aggregate(Max("id"))["id__max"] or 0
+
+        # ignore_conflicts covers a tweet that's stored after all,
+        # e.g. by a concurrent writer between our lookup and the insert
+        Tweet.objects.bulk_create(new_tweets, batch_size=500, ignore_conflicts=True)
+
+        # MySQL does not return primary keys from bulk_create
+        pks = dict(stored.values_list("tweet_id", "id"))
+
+        # Only the tweets actually inserted are new
+        new_tweets = [t for t in new_tweets if pks[t.tweet_id] > mark]
+
+        TweetEntity.objects.bulk_create(
+            [e for t in new_tweets for e in buildEntities(t, pks[t.tweet_id])],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+        existing_links = set(
+            TweetHashtagMap.objects.filter(
+                tweet_id__in=pks.values()
+            ).values_list("tweet_id", "hashtag_id")
+        )
+
+        map_objects = []
+
+        for tweet_id, hashtags in links.items():
+            for hashtag_id in hashtags:
+                if (pks[tweet_id], hashtag_id) not in existing_links:
+                    map_objects.append(
+                        TweetHashtagMap(tweet_id=pks[tweet_id], hashtag_id=hashtag_id)
+                    )
+
+        TweetHashtagMap.objects.bulk_create(map_objects, batch_size=500, ignore_conflicts=True)
+
+    return {"inserted": len(new_tweets), "skipped": len(tweets) - len(new_tweets)}